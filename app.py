@@ -2,16 +2,35 @@
 import streamlit as st
 import asyncio
 import logging
+import re
+import sys
 
-from core.ui.components.analytics import show_analytics_page
-from core.ui.pages.home import show_home_page
-from core.ui.utils.session import SessionManager
-from core.ui.utils.styling import apply_custom_css
+from configs.settings import get_config
+from ui.components.analytics import show_analytics_page
+from ui.pages.home import show_home_page
+from utils.session import SessionManager
+from utils.styling import apply_custom_css
+from utils.cache import (
+    get_db_manager, get_user_service, get_hybrid_system, get_user_stats,
+    get_user_by_username, invalidate_user_cache
+)
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging once; Streamlit re-executes this script on every rerun
+if not logging.getLogger().handlers:
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(name)s %(message)s"
+    )
 logger = logging.getLogger(__name__)
 
+# Faster event loop for asyncio.run() calls made by the recommendation flow
+if sys.platform != "win32":
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
+
 # Page configuration - moved to top to avoid context issues
 st.set_page_config(
     page_title="🎵 AI Music Curator Pro",
@@ -20,6 +39,30 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+_EMAIL_MATCH = re.compile(r"[^@]+@[^@]+\.[^@]+").match
+
+# (predicate(username, email, password, confirm_password, terms_accepted), error message)
+_REGISTER_RULES = (
+    (lambda u, e, p, c, t: bool(u) and len(u) >= 3, "Username must be at least 3 characters"),
+    (lambda u, e, p, c, t: bool(e) and _EMAIL_MATCH(e) is not None, "Valid email is required"),
+    (lambda u, e, p, c, t: bool(p) and len(p) >= 6, "Password must be at least 6 characters"),
+    (lambda u, e, p, c, t: p == c, "Passwords don't match"),
+    (lambda u, e, p, c, t: t, "Please accept the Terms of Service"),
+)
+
+GENRES = (
+    "Rock", "Pop", "Electronic", "Hip-Hop", "Jazz", "Classical",
+    "Country", "R&B", "Indie", "Alternative"
+)
+
+PAGES = (
+    "🎵 Music Discovery",
+    "📊 Analytics & Reports",
+    "👤 Profile Settings"
+)
+
+AUTH_TABS = ("🔑 Login", "🆕 Register")
+
 class MusicCuratorApp:
     """Main application class"""
     
@@ -28,7 +71,8 @@ class MusicCuratorApp:
         self.db_manager = None
         self.user_service = None
         self.session_manager = None
-        self.hybrid_system = None
+        self._page_handlers = {}
+        self._auth_forms = ()
         
         # Initialize components
         self._init_components()
@@ -36,57 +80,67 @@ class MusicCuratorApp:
     def _init_components(self):
         """Initialize application components"""
         try:
-            # Import components here to avoid context issues
-            from configs.settings import Config
-            from database.manager import DatabaseManager
-            from services.user_service import UserService
-
-            
             # Initialize configuration
-            self.config = Config()
+            self.config = get_config()
             
-            # Initialize database
-            self.db_manager = DatabaseManager(self.config.database.db_path)
+            # Initialize database (cached across reruns)
+            self.db_manager = get_db_manager(
+                self.config.database.db_path,
+                pool_size=self.config.database.pool_size,
+                pool_timeout=self.config.database.pool_timeout
+            )
             
             # Initialize services
-            self.user_service = UserService(self.db_manager)
+            self.user_service = get_user_service(self.db_manager)
             self.session_manager = SessionManager()
             
-            # Apply custom styling
-            apply_custom_css()
+            # Page dispatch; every handler takes (hybrid_system)
+            self._page_handlers = dict(zip(PAGES, (
+                self._show_home_page,
+                self._show_analytics_page,
+                self._show_profile_page
+            )))
+            self._auth_forms = (self._show_login_form, self._show_register_form)
             
             logger.info("✅ Application components initialized successfully")
             
         except Exception as e:
-            logger.error(f"❌ Failed to initialize components: {e}")
+            logger.error("❌ Failed to initialize components: %s", e)
             st.error(f"Failed to initialize application: {e}")
             st.stop()
     
     def _init_hybrid_system(self):
-        """Initialize the hybrid LLM+RL system when needed"""
-        if self.hybrid_system is None:
-            try:
-                from core.hybrid_system import HybridMusicSystem
-                self.hybrid_system = HybridMusicSystem(self.config, self.db_manager)
-                logger.info("✅ Hybrid system initialized")
-            except Exception as e:
-                logger.error(f"❌ Failed to initialize hybrid system: {e}")
-                st.error("Failed to initialize AI system. Please check configuration.")
-                return None
-        
-        return self.hybrid_system
+        """Initialize the hybrid LLM+RL system when needed (cached across reruns)"""
+        try:
+            return get_hybrid_system(self.config, self.db_manager)
+        except Exception as e:
+            logger.error("❌ Failed to initialize hybrid system: %s", e)
+            st.error("Failed to initialize AI system. Please check configuration.")
+            return None
     
     def run(self):
         """Main application entry point"""
         
+        # Styling has to be re-emitted on every rerun
+        apply_custom_css()
+        
         # Initialize session state if needed
         if 'app_initialized' not in st.session_state:
             st.session_state.app_initialized = True
         
-        # Check authentication
-        if not self.session_manager.is_authenticated():
-            self._show_authentication()
-            return
+        # Check authentication (one session lookup per rerun)
+        user = self.session_manager.get_current_user()
+        if user is None:
+            auth_placeholder = st.empty()
+            with auth_placeholder.container():
+                self._show_authentication()
+            
+            user = self.session_manager.get_current_user()
+            if user is None:
+                return
+            
+            # Logged in during this run: swap the auth page for the app without a rerun
+            auth_placeholder.empty()
         
         # Initialize hybrid system if authenticated
         hybrid_system = self._init_hybrid_system()
@@ -94,7 +148,7 @@ class MusicCuratorApp:
             return
         
         # Show main application
-        self._show_main_app(hybrid_system)
+        self._show_main_app(user, hybrid_system)
     
     def _show_authentication(self):
         """Show login/register page"""
@@ -105,13 +159,9 @@ class MusicCuratorApp:
         </div>
         """, unsafe_allow_html=True)
         
-        tab1, tab2 = st.tabs(["🔑 Login", "🆕 Register"])
-        
-        with tab1:
-            self._show_login_form()
-        
-        with tab2:
-            self._show_register_form()
+        for tab, show_form in zip(st.tabs(AUTH_TABS), self._auth_forms):
+            with tab:
+                show_form()
     
     def _show_login_form(self):
         """Show login form"""
@@ -124,10 +174,8 @@ class MusicCuratorApp:
             
             if st.form_submit_button("Login", type="primary"):
                 if self.user_service.authenticate(username, password):
-                    user = self.user_service.get_user_by_username(username)
+                    user = get_user_by_username(self.user_service, username)
                     self.session_manager.login(user, remember_me)
-                    st.success("Login successful!")
-                    st.rerun()
                 else:
                     st.error("Invalid credentials")
     
@@ -150,17 +198,10 @@ class MusicCuratorApp:
             
             if st.form_submit_button("Create Account", type="primary"):
                 # Validation
-                errors = []
-                if not username or len(username) < 3:
-                    errors.append("Username must be at least 3 characters")
-                if not email or "@" not in email:
-                    errors.append("Valid email is required")
-                if not password or len(password) < 6:
-                    errors.append("Password must be at least 6 characters")
-                if password != confirm_password:
-                    errors.append("Passwords don't match")
-                if not terms_accepted:
-                    errors.append("Please accept the Terms of Service")
+                errors = [
+                    message for predicate, message in _REGISTER_RULES
+                    if not predicate(username, email, password, confirm_password, terms_accepted)
+                ]
                 
                 if errors:
                     for error in errors:
@@ -168,68 +209,77 @@ class MusicCuratorApp:
                 else:
                     # Create user
                     if self.user_service.create_user(username, email, password, full_name):
+                        invalidate_user_cache()
                         st.success("Account created! Please log in.")
                     else:
                         st.error("Username or email already exists")
     
-    def _show_main_app(self, hybrid_system):
+    def _show_main_app(self, user, hybrid_system):
         """Show main application interface"""
-        user = self.session_manager.get_current_user()
-        
         # Sidebar navigation
         with st.sidebar:
             st.markdown(f"### Welcome, {user['full_name'] or user['username']}!")
             
             # User stats
-            stats = self.user_service.get_user_stats(user['id'])
-            
-            col1, col2 = st.columns(2)
-            with col1:
-                st.metric("Queries", stats['total_interactions'])
-                st.metric("Ratings", stats['total_feedback'])
-            with col2:
-                # Simple personalization calculation
-                personalization = min(100, (stats['total_feedback'] / 20) * 100)
-                st.metric("AI Level", f"{personalization:.0f}%")
-                if stats['average_rating'] > 0:
-                    st.metric("Avg Rating", f"{stats['average_rating']:.1f}/5")
+            self._show_sidebar_stats(user)
             
-            # Navigation
-            page = st.selectbox("Navigate", [
-                "🎵 Music Discovery",
-                "📊 Analytics & Reports", 
-                "👤 Profile Settings"
-            ])
+            # Navigation (outside the fragments: switching pages needs a full rerun)
+            page = st.selectbox("Navigate", PAGES)
             
             # Quick actions
             st.markdown("---")
-            if st.button("🔄 Retrain AI"):
-                with st.spinner("Training AI model..."):
-                    # Simple retraining simulation
-                    if stats['total_feedback'] >= 5:
-                        st.success("AI model updated!")
-                    else:
-                        needed = 5 - stats['total_feedback']
-                        st.warning(f"Need {needed} more ratings to train AI")
-            
-            if st.button("🚪 Logout"):
-                self.session_manager.logout()
-                st.rerun()
+            self._show_sidebar_actions()
         
         # Main content area
-        if page == "🎵 Music Discovery":
-            self._show_home_page(user, hybrid_system)
-        elif page == "📊 Analytics & Reports":
-            self._show_analytics_page(user)
-        elif page == "👤 Profile Settings":
-            self._show_profile_page(user)
+        self._page_handlers[page](hybrid_system)
+    
+    def _session_user(self):
+        """Current user for a fragment; fragment reruns skip run()'s session check"""
+        user = self.session_manager.get_current_user()
+        if user is None:
+            # Session expired: a full rerun falls through to the login page
+            st.rerun(scope="app")
+        return user
+    
+    def _show_sidebar_stats(self, user):
+        """Sidebar metrics; refreshed by full-app reruns, e.g. after feedback"""
+        stats = get_user_stats(self.user_service, user['id'])
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            st.metric("Queries", stats['total_interactions'])
+            st.metric("Ratings", stats['total_feedback'])
+        with col2:
+            # Simple personalization calculation
+            personalization = min(100, (stats['total_feedback'] / 20) * 100)
+            st.metric("AI Level", f"{personalization:.0f}%")
+            if stats['average_rating'] > 0:
+                st.metric("Avg Rating", f"{stats['average_rating']:.1f}/5")
+    
+    @st.fragment
+    def _show_sidebar_actions(self):
+        """Retrain/logout buttons; reruns on its own instead of with the page"""
+        user = self._session_user()
+        if st.button("🔄 Retrain AI"):
+            stats = get_user_stats(self.user_service, user['id'])
+            with st.spinner("Training AI model..."):
+                # Simple retraining simulation
+                if stats['total_feedback'] >= 5:
+                    st.success("AI model updated!")
+                else:
+                    needed = 5 - stats['total_feedback']
+                    st.warning(f"Need {needed} more ratings to train AI")
+        
+        if st.button("🚪 Logout"):
+            self.session_manager.logout()
+            st.rerun()
     
-    def _show_home_page(self, user, hybrid_system):
+    @st.fragment
+    def _show_home_page(self, hybrid_system):
         """Show home page with music recommendations"""
+        user = self._session_user()
         
-        # Import here to avoid context issues
         try:
-           
             show_home_page(user, hybrid_system, self.db_manager)
         except ImportError:
             # Fallback simple implementation
@@ -246,17 +296,18 @@ class MusicCuratorApp:
                 else:
                     st.warning("Please enter a music query")
     
-    def _show_analytics_page(self, user):
+    @st.fragment
+    def _show_analytics_page(self, hybrid_system=None):
         """Show analytics page"""
+        user = self._session_user()
         
         try:
-  
             show_analytics_page(user, self.db_manager)
         except ImportError:
             # Fallback simple implementation
             st.markdown("### 📊 Analytics Dashboard")
             
-            stats = self.user_service.get_user_stats(user['id'])
+            stats = get_user_stats(self.user_service, user['id'])
             
             col1, col2, col3 = st.columns(3)
             
@@ -277,8 +328,10 @@ class MusicCuratorApp:
             else:
                 st.write("📊 Detailed analytics will be available once you use the system more.")
     
-    def _show_profile_page(self, user):
+    @st.fragment
+    def _show_profile_page(self, hybrid_system=None):
         """Show profile settings page"""
+        user = self._session_user()
         
         st.markdown("### 👤 Profile Settings")
         
@@ -294,11 +347,11 @@ class MusicCuratorApp:
             with col2:
                 # Music preferences
                 st.markdown("**Music Preferences:**")
+                saved_genres = (user.get('preferences') or {}).get('favorite_genres', [])
                 favorite_genres = st.multiselect(
                     "Favorite Genres",
-                    ["Rock", "Pop", "Electronic", "Hip-Hop", "Jazz", "Classical", 
-                     "Country", "R&B", "Indie", "Alternative"],
-                    default=[]
+                    GENRES,
+                    default=[genre for genre in saved_genres if genre in GENRES]
                 )
             
             # Settings
@@ -315,6 +368,11 @@ class MusicCuratorApp:
                 }
                 
                 if self.user_service.update_user_preferences(user['id'], preferences):
+                    invalidate_user_cache()
+                    # Later fragment reruns read the saved profile, not the login-time copy
+                    saved_user = self.user_service.get_user_by_id(user['id'])
+                    if saved_user:
+                        self.session_manager.update_user_data(saved_user)
                     st.success("Profile updated successfully!")
                 else:
                     st.error("Failed to update profile")
@@ -336,6 +394,7 @@ class MusicCuratorApp:
                         st.error("Password must be at least 6 characters")
                     else:
                         if self.user_service.change_password(user['id'], old_password, new_password):
+                            invalidate_user_cache()
                             st.success("Password changed successfully!")
                         else:
                             st.error("Current password is incorrect")
@@ -350,10 +409,14 @@ class MusicCuratorApp:
 def main():
     """Application entry point"""
     try:
-        app = MusicCuratorApp()
+        # One app instance per browser session instead of one per rerun
+        app = st.session_state.get("_app")
+        if app is None:
+            app = MusicCuratorApp()
+            st.session_state["_app"] = app
         app.run()
     except Exception as e:
-        logger.error(f"Application error: {e}")
+        logger.error("Application error: %s", e)
         st.error(f"Application error: {e}")
         st.write("Please refresh the page or contact support if the problem persists.")
 
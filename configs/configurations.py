@@ -1,10 +1,18 @@
+from functools import lru_cache
 from langchain_openai import ChatOpenAI
 from dotenv import load_dotenv
 
 load_dotenv()
 
+@lru_cache(maxsize=1)
+def get_llm() -> ChatOpenAI:
+    return ChatOpenAI(temperature=0.3, model="gpt-3.5-turbo",)
+
 class Config:
-    llm = ChatOpenAI(temperature=0.3, model="gpt-3.5-turbo",)
+    @property
+    def llm(self) -> ChatOpenAI:
+        # Built on first use and shared, instead of at import time
+        return get_llm()
 
 
 config = Config()
\ No newline at end of file
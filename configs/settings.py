@@ -1,5 +1,6 @@
 import os
 from dataclasses import dataclass
+from functools import lru_cache
 from typing import Optional
 from dotenv import load_dotenv
 
@@ -10,6 +11,8 @@ class DatabaseConfig:
     db_path: str = "data/music_app.db"
     backup_enabled: bool = True
     backup_interval_hours: int = 24
+    pool_size: int = 8
+    pool_timeout: int = 5
 
 @dataclass
 class LLMConfig:
@@ -26,6 +29,15 @@ class ReinforcementLearningConfig:
     exploration_rate: float = 0.1
     discount_factor: float = 0.95
     update_frequency: int = 10
+    # Per-user datasets are small (tens to hundreds of ratings); a small forest fits them
+    rf_n_estimators: int = 30
+    # From this many training ratings on, HistGradientBoostingRegressor replaces the forest;
+    # below it, its 20-sample leaves and early-stopping holdout leave too little to learn from
+    hgb_min_samples: int = 200
+    # Below this many training ratings the forest's out-of-bag score stands in for 3-fold CV
+    cv_skip_threshold: int = 50
+    # User models kept in memory; the rest are loaded from data/models on demand
+    max_cached_models: int = 256
 
 @dataclass
 class MusicAPIConfig:
@@ -34,6 +46,7 @@ class MusicAPIConfig:
     itunes_enabled: bool = True
     musicbrainz_enabled: bool = True
     rate_limit_per_minute: int = 100
+    max_concurrent_requests: int = 8
 
 @dataclass
 class UIConfig:
@@ -48,7 +61,9 @@ class Config:
     def __init__(self):
         self.database = DatabaseConfig(
             db_path=os.getenv("DB_PATH", "data/music_app.db"),
-            backup_enabled=os.getenv("DB_BACKUP_ENABLED", "true").lower() == "true"
+            backup_enabled=os.getenv("DB_BACKUP_ENABLED", "true").lower() == "true",
+            pool_size=int(os.getenv("DB_POOL_SIZE", "8")),
+            pool_timeout=int(os.getenv("DB_POOL_TIMEOUT", "5"))
         )
         
         self.llm = LLMConfig(
@@ -63,7 +78,8 @@ class Config:
         )
         
         self.music_api = MusicAPIConfig(
-            lastfm_api_key=os.getenv("LASTFM_API_KEY", "")
+            lastfm_api_key=os.getenv("LASTFM_API_KEY", ""),
+            max_concurrent_requests=int(os.getenv("MUSIC_API_MAX_CONCURRENT", "8"))
         )
         
         self.ui = UIConfig(
@@ -80,3 +96,8 @@ class Config:
         
         if self.rl.min_training_samples < 3:
             raise ValueError("RL_MIN_SAMPLES must be at least 3")
+
+@lru_cache(maxsize=1)
+def get_config() -> Config:
+    """Parse and validate the environment once per process"""
+    return Config()
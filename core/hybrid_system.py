@@ -1,7 +1,17 @@
-import json
-from typing import Dict, List
+import asyncio
+import atexit
+import bisect
+import concurrent.futures
+import queue
+import threading
+import numpy as np
+import orjson
+from collections import Counter
+from typing import Dict, FrozenSet, List, Optional, Tuple
 from datetime import datetime
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+
+from cachetools import TTLCache
 
 from main import ModernMusicRecommender
 from ml.reinforcement_learning import ReinforcementLearningEngine
@@ -24,8 +34,27 @@ class RecommendationResponse:
     rl_insights: Dict
     hybrid_score: float
     processing_time_ms: int
+    # Pending interaction-log write; resolves to the row id once the writer commits it
+    interaction: Optional[concurrent.futures.Future] = field(default=None, repr=False)
+    
+    @property
+    def interaction_id(self) -> Optional[int]:
+        """Logged interaction referenced by track feedback; waits for the write only if still queued"""
+        if self.interaction is None:
+            return None
+        try:
+            return self.interaction.result(timeout=HybridMusicSystem.LOG_WRITE_TIMEOUT)
+        except Exception:
+            return None
 
 class HybridMusicSystem:
+    LOG_BATCH_SIZE = 200
+    LOG_WRITE_TIMEOUT = 5  # seconds a reader of interaction_id waits for the write
+    _LOG_STOP = object()  # queued by close(); the writer flushes what it holds and exits
+    _HOUR_KEYS = tuple(str(hour) for hour in range(24))
+    _ENERGY_THRESHOLDS = (0.4, 0.7)
+    _ENERGY_LABELS = ("low", "moderate", "high")
+    
     def __init__(self, config, db_manager):
         self.config = config
         self.db_manager = db_manager
@@ -34,7 +63,20 @@ class HybridMusicSystem:
         self.llm_rl_integrator = LLMRLIntegrator(config)
         self.analytics_service = AnalyticsService(db_manager)
         self.user_models = {}
-        self.user_contexts = {}
+        self.user_contexts = TTLCache(maxsize=10_000, ttl=300)
+        self._user_contexts_lock = threading.RLock()
+        # Last good LLM response per (user_id, query), reused by the fallback path; built from the
+        # pattern-enhanced query, so a user's entries are dropped when their feedback changes
+        self.llm_responses = TTLCache(maxsize=1_000, ttl=300)
+        self._llm_responses_lock = threading.Lock()
+        # Interaction logs go through a single background writer that commits concurrent requests together
+        self._log_queue = queue.Queue()
+        self._log_writer = threading.Thread(
+            target=self._flush_interaction_logs, name="interaction-log-writer", daemon=True
+        )
+        self._log_writer.start()
+        # The writer is a daemon, so queued rows are written out explicitly before exit
+        atexit.register(self.close)
     
     async def get_recommendations(self, request: RecommendationRequest) -> RecommendationResponse:
         start_time = datetime.now()
@@ -43,46 +85,63 @@ class HybridMusicSystem:
             enhanced_query = await self._enhance_query_with_patterns(
                 request.query, request.user_id, user_context
             )
-            llm_response = await self.llm_recommender.get_recommendations(
-                str(request.user_id), enhanced_query
+            # The LLM call needs the pattern-enhanced query, but the RL gate doesn't need the LLM
+            llm_response, has_training_data = await asyncio.gather(
+                self.llm_recommender.get_recommendations(str(request.user_id), enhanced_query),
+                asyncio.to_thread(self._has_sufficient_training_data, request.user_id)
             )
-            if request.use_rl_enhancement and self._has_sufficient_training_data(request.user_id):
-                rl_enhanced_tracks = await self._apply_rl_enhancement(
+            if 'error' not in llm_response:
+                self._extract_llm_insights(llm_response)
+                with self._llm_responses_lock:
+                    self.llm_responses[(request.user_id, request.query)] = llm_response
+            if request.use_rl_enhancement and has_training_data:
+                rl_enhanced_tracks, order_changed = await self._apply_rl_enhancement(
                     llm_response['recommendations'], request.user_id, user_context
                 )
             else:
-                rl_enhanced_tracks = llm_response['recommendations']
+                rl_enhanced_tracks, order_changed = llm_response['recommendations'], False
             hybrid_reasoning = await self._generate_hybrid_reasoning(
-                llm_response, rl_enhanced_tracks, user_context
+                llm_response, rl_enhanced_tracks, user_context, order_changed
             )
             hybrid_score = self._calculate_hybrid_confidence(
                 llm_response, rl_enhanced_tracks, user_context
             )
-            await self._log_interaction(request, rl_enhanced_tracks, user_context)
+            interaction = await self._log_interaction(request, rl_enhanced_tracks, user_context)
+            rl_insights = await asyncio.to_thread(self._extract_rl_insights, request.user_id)
             processing_time = (datetime.now() - start_time).total_seconds() * 1000
             return RecommendationResponse(
                 tracks=rl_enhanced_tracks[:request.max_results],
                 reasoning=hybrid_reasoning,
                 llm_insights=self._extract_llm_insights(llm_response),
-                rl_insights=self._extract_rl_insights(request.user_id),
+                rl_insights=rl_insights,
                 hybrid_score=hybrid_score,
-                processing_time_ms=int(processing_time)
+                processing_time_ms=int(processing_time),
+                interaction=interaction
             )
             
         except Exception as e:
             return await self._fallback_recommendations(request, str(e))
     
     async def _get_enhanced_user_context(self, user_id: int) -> Dict:
-        if user_id in self.user_contexts:
-            cache_time = self.user_contexts[user_id]['timestamp']
-            if (datetime.now() - cache_time).seconds < 300: 
-                return self.user_contexts[user_id]['context']
+        with self._user_contexts_lock:
+            context = self.user_contexts.get(user_id)
+        if context is not None:
+            return context
         
-        user_data = self.db_manager.get_user_data(user_id)
-        recent_interactions = self.db_manager.get_recent_interactions(user_id, limit=20)
-        feedback_patterns = self.db_manager.get_feedback_patterns(user_id)
-        rl_insights = self.rl_engine.get_user_insights(user_id)
-        temporal_patterns = self.analytics_service.get_temporal_patterns(user_id)
+        # Independent reads, each on its own pooled connection
+        (
+            user_data,
+            recent_interactions,
+            feedback_patterns,
+            rl_insights,
+            temporal_patterns
+        ) = await asyncio.gather(
+            asyncio.to_thread(self.db_manager.get_user_data, user_id),
+            asyncio.to_thread(self.db_manager.get_recent_interactions, user_id, 20),
+            asyncio.to_thread(self.db_manager.get_feedback_patterns, user_id),
+            asyncio.to_thread(self.rl_engine.get_user_insights, user_id),
+            asyncio.to_thread(self.analytics_service.get_temporal_patterns, user_id)
+        )
         context = {
             'user_data': user_data,
             'recent_interactions': recent_interactions,
@@ -92,9 +151,20 @@ class HybridMusicSystem:
             'timestamp': datetime.now()
         }
         
-        self.user_contexts[user_id] = {'context': context, 'timestamp': datetime.now()}
+        with self._user_contexts_lock:
+            self.user_contexts[user_id] = context
         return context
     
+    def _invalidate_user_context(self, user_id: int):
+        with self._user_contexts_lock:
+            self.user_contexts.pop(user_id, None)
+    
+    def _invalidate_llm_responses(self, user_id: int):
+        with self._llm_responses_lock:
+            stale = [key for key in self.llm_responses if key[0] == user_id]
+            for key in stale:
+                self.llm_responses.pop(key, None)
+    
     async def _enhance_query_with_patterns(self, query: str, user_id: int, context: Dict) -> str:
         rl_insights = context.get('rl_insights', {})
         feedback_patterns = context.get('feedback_patterns', {})
@@ -107,15 +177,14 @@ class HybridMusicSystem:
             moods = feedback_patterns['preferred_moods'][:2]
             enhancements.append(f"Often seeks {' and '.join(moods)} music")
 
-        current_hour = datetime.now().hour
-        temporal_patterns = context.get('temporal_patterns', {})
-        if str(current_hour) in temporal_patterns.get('hourly_preferences', {}):
-            hour_pref = temporal_patterns['hourly_preferences'][str(current_hour)]
+        hourly_preferences = context.get('temporal_patterns', {}).get('hourly_preferences', {})
+        hour_pref = hourly_preferences.get(self._HOUR_KEYS[datetime.now().hour])
+        if hour_pref is not None:
             enhancements.append(f"At this time usually prefers {hour_pref}")
         
-        if rl_insights.get('average_energy_preference'):
-            energy = rl_insights['average_energy_preference']
-            energy_desc = "high" if energy > 0.7 else "moderate" if energy > 0.4 else "low"
+        energy = rl_insights.get('average_energy_preference')
+        if energy:
+            energy_desc = self._ENERGY_LABELS[bisect.bisect_left(self._ENERGY_THRESHOLDS, energy)]
             enhancements.append(f"Typically prefers {energy_desc} energy music")
         
         if enhancements:
@@ -125,68 +194,70 @@ class HybridMusicSystem:
         
         return enhanced_query
     
-    async def _apply_rl_enhancement(self, tracks: List[Dict], user_id: int, context: Dict) -> List[Dict]:
-        enhanced_tracks = []
+    async def _apply_rl_enhancement(self, tracks: List[Dict], user_id: int, context: Dict) -> Tuple[List[Dict], bool]:
+        """RL-rescored tracks, best first, and whether that reordered the LLM ranking"""
+        if not tracks:
+            return [], False
         
-        for track in tracks:
-            rl_prediction = self.rl_engine.predict_user_rating(
-                user_id, track, context
-            )
-            base_score = track.get('ranking_score', 0)
-            rl_bonus = (rl_prediction - 3.0) * 5 
-            diversity_penalty = self._calculate_diversity_penalty(track, context['recent_interactions'])
-            enhanced_score = base_score + rl_bonus - diversity_penalty
-            enhanced_track = track.copy()
+        # One forward pass over every candidate instead of a model call per track
+        rl_predictions, rl_confidence = await asyncio.to_thread(
+            self.rl_engine.predict_with_confidence, user_id, tracks, context
+        )
+        
+        artist_counts, recent_genres = self._flatten_recent(context['recent_interactions'])
+        base_scores = np.fromiter((t.get('ranking_score', 0) for t in tracks), dtype=float, count=len(tracks))
+        diversity_penalties = np.fromiter(
+            (self._calculate_diversity_penalty(t, artist_counts, recent_genres) for t in tracks),
+            dtype=float, count=len(tracks)
+        )
+        rl_bonuses = (rl_predictions - 3.0) * 5
+        enhanced_scores = base_scores + rl_bonuses - diversity_penalties
+        
+        order = np.argsort(-enhanced_scores, kind='stable')
+        order_changed = bool((order != np.arange(len(tracks))).any())
+        enhanced_tracks = []
+        for i in order:
+            enhanced_track = tracks[i].copy()
             enhanced_track.update({
-                'rl_predicted_rating': rl_prediction,
-                'rl_bonus': rl_bonus,
-                'diversity_penalty': diversity_penalty,
-                'enhanced_score': enhanced_score,
-                'rl_confidence': self.rl_engine.get_prediction_confidence(user_id, track)
+                'rl_predicted_rating': float(rl_predictions[i]),
+                'rl_bonus': float(rl_bonuses[i]),
+                'diversity_penalty': float(diversity_penalties[i]),
+                'enhanced_score': float(enhanced_scores[i]),
+                'rl_confidence': rl_confidence
             })
-            
             enhanced_tracks.append(enhanced_track)
-        enhanced_tracks.sort(key=lambda x: x.get('enhanced_score', 0), reverse=True)
 
-        return enhanced_tracks
+        return enhanced_tracks, order_changed
     
-    def _calculate_diversity_penalty(self, track: Dict, recent_interactions: List[Dict]) -> float:
-        
-        penalty = 0.0
-        track_artist = track.get('artist', '').lower()
-        recent_artists = [
-            r.get('artist', '').lower() 
-            for interaction in recent_interactions 
-            for r in json.loads(interaction.get('recommendations', '[]'))
+    def _flatten_recent(self, recent_interactions: List[Dict]) -> Tuple[Counter, FrozenSet[str]]:
+        """Decode recent recommendations once per request: (artist counts, last 10 genres), lowercased"""
+        recent_tracks = [
+            r for interaction in recent_interactions
+            for r in orjson.loads(interaction.get('recommendations') or b'[]')
         ]
+        artist_counts = Counter(r.get('artist', '').lower() for r in recent_tracks)
+        recent_genres = [tag.lower() for r in recent_tracks for tag in r.get('lastfm_tags', [])]
         
-        artist_count = recent_artists.count(track_artist)
-        if artist_count > 0:
-            penalty += artist_count * 2.0  
-        
-        track_genres = [tag.lower() for tag in track.get('lastfm_tags', [])]
-        recent_genres = []
-        for interaction in recent_interactions:
-            for r in json.loads(interaction.get('recommendations', '[]')):
-                recent_genres.extend([tag.lower() for tag in r.get('lastfm_tags', [])])
-        
-        genre_overlap = len(set(track_genres) & set(recent_genres[-10:]))  # Last 10 genres
-        penalty += genre_overlap * 0.5
+        return artist_counts, frozenset(recent_genres[-10:])  # Last 10 genres
+    
+    def _calculate_diversity_penalty(self, track: Dict, artist_counts: Counter, recent_genres: FrozenSet[str]) -> float:
+        track_artist = track.get('artist', '').lower()
+        track_genres = {tag.lower() for tag in track.get('lastfm_tags', [])}
+        penalty = artist_counts.get(track_artist, 0) * 2.0 + len(track_genres & recent_genres) * 0.5
         
         return min(penalty, 10.0)  # Cap penalty
     
-    async def _generate_hybrid_reasoning(self, llm_response: Dict, rl_tracks: List[Dict], context: Dict) -> str:
+    async def _generate_hybrid_reasoning(self, llm_response: Dict, rl_tracks: List[Dict], context: Dict,
+                                         order_changed: bool) -> str:
         llm_reasoning = llm_response.get('reasoning', '')
         rl_insights = []
-        original_order = [t['name'] for t in llm_response.get('recommendations', [])]
-        rl_order = [t['name'] for t in rl_tracks]
         
-        if original_order != rl_order:
+        if order_changed:
             rl_insights.append("I've personalized these recommendations based on your listening history")
 
-        high_confidence_tracks = [t for t in rl_tracks if t.get('rl_confidence', 0) > 0.8]
-        if high_confidence_tracks:
-            rl_insights.append(f"I'm especially confident about {len(high_confidence_tracks)} of these recommendations")
+        high_confidence_count = sum(1 for t in rl_tracks if t.get('rl_confidence', 0) > 0.8)
+        if high_confidence_count:
+            rl_insights.append(f"I'm especially confident about {high_confidence_count} of these recommendations")
 
         training_samples = context.get('rl_insights', {}).get('training_samples', 0)
         if training_samples > 20:
@@ -207,43 +278,93 @@ class HybridMusicSystem:
         training_samples = rl_insights.get('training_samples', 0)
         model_accuracy = rl_insights.get('model_accuracy', 0.5)
         
-        if training_samples >= 20:
-            rl_confidence = model_accuracy
-        elif training_samples >= 5:
-            rl_confidence = model_accuracy * 0.7
-        else:
-            rl_confidence = 0.3  
-        
-        if training_samples >= 5:
-            hybrid_confidence = (llm_confidence * 0.6) + (rl_confidence * 0.4)
-        else:
-            hybrid_confidence = llm_confidence * 0.9
+        # Below 5 samples the RL side is ignored; from 20 up the model accuracy counts in full
+        trained = training_samples >= 5
+        rl_confidence = model_accuracy * (0.7 + 0.3 * (training_samples >= 20))
+        hybrid_confidence = (
+            trained * (llm_confidence * 0.6 + rl_confidence * 0.4)
+            + (not trained) * llm_confidence * 0.9
+        )
         
         return min(max(hybrid_confidence, 0.0), 1.0)
     
+    def _get_feedback_count(self, user_id: int) -> int:
+        # Shared with the RL engine, so one invalidation after new feedback covers both
+        return self.rl_engine.get_feedback_count(user_id)
+    
+    def _invalidate_feedback_count(self, user_id: int):
+        self.rl_engine.invalidate_feedback_count(user_id)
+    
     def _has_sufficient_training_data(self, user_id: int) -> bool:
-        feedback_count = self.db_manager.get_user_feedback_count(user_id)
-        return feedback_count >= self.config.rl.min_training_samples
+        return self._get_feedback_count(user_id) >= self.config.rl.min_training_samples
     
-    async def _log_interaction(self, request: RecommendationRequest, tracks: List[Dict], context: Dict):
+    async def _log_interaction(self, request: RecommendationRequest, tracks: List[Dict],
+                               context: Dict) -> concurrent.futures.Future:
         interaction_data = {
             'user_id': request.user_id,
             'query': request.query,
             'recommendations': tracks,
             'context': context,
             'timestamp': datetime.now().isoformat(),
-            'rl_enhanced': request.use_rl_enhancement and self._has_sufficient_training_data(request.user_id)
+            'rl_enhanced': request.use_rl_enhancement and await asyncio.to_thread(
+                self._has_sufficient_training_data, request.user_id
+            )
         }
         
-        self.db_manager.log_interaction(interaction_data)
+        # The writer resolves the future with the row id once its batch commits; the request
+        # returns without waiting for that
+        written = concurrent.futures.Future()
+        self._log_queue.put_nowait((interaction_data, written))
+        return written
+    
+    def _flush_interaction_logs(self):
+        stopping = False
+        while not stopping:
+            first = self._log_queue.get()
+            if first is self._LOG_STOP:
+                return
+            batch = [first]
+            # Group commit: whatever queued up while the previous batch was written goes in together
+            while len(batch) < self.LOG_BATCH_SIZE:
+                try:
+                    item = self._log_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is self._LOG_STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            try:
+                ids = self.db_manager.log_interactions_batch([data for data, _ in batch])
+            except Exception as e:
+                # A bad batch fails only its own requests; the writer keeps serving the queue
+                for _, written in batch:
+                    if written.set_running_or_notify_cancel():
+                        written.set_exception(e)
+                continue
+            for i, (_, written) in enumerate(batch):
+                # A request that gave up waiting cancelled its future; resolving it would raise
+                if written.set_running_or_notify_cancel():
+                    written.set_result(ids[i] if ids else None)
+    
+    def close(self, timeout: float = 5):
+        """Write out every queued interaction log and stop the writer thread"""
+        if not self._log_writer.is_alive():
+            return
+        self._log_queue.put(self._LOG_STOP)
+        self._log_writer.join(timeout)
     
     def _extract_llm_insights(self, llm_response: Dict) -> Dict:
-        return {
-            'mood_analysis': llm_response.get('mood_analysis', {}),
-            'musical_context': llm_response.get('musical_context', {}),
-            'reasoning_quality': len(llm_response.get('reasoning', '')) > 50,
-            'total_candidates': llm_response.get('total_candidates', 0)
-        }
+        # Stashed on the response so the fallback path can reuse a cached response's insights
+        insights = llm_response.get('_insights')
+        if insights is None:
+            insights = llm_response['_insights'] = {
+                'mood_analysis': llm_response.get('mood_analysis', {}),
+                'musical_context': llm_response.get('musical_context', {}),
+                'reasoning_quality': len(llm_response.get('reasoning', '')) > 50,
+                'total_candidates': llm_response.get('total_candidates', 0)
+            }
+        return insights
     
     def _extract_rl_insights(self, user_id: int) -> Dict:
         """Extract insights from RL system"""
@@ -251,9 +372,12 @@ class HybridMusicSystem:
     
     async def _fallback_recommendations(self, request: RecommendationRequest, error: str) -> RecommendationResponse:
         try:
-            llm_response = await self.llm_recommender.get_recommendations(
-                str(request.user_id), request.query
-            )
+            with self._llm_responses_lock:
+                llm_response = self.llm_responses.get((request.user_id, request.query))
+            if llm_response is None:
+                llm_response = await self.llm_recommender.get_recommendations(
+                    str(request.user_id), request.query
+                )
             
             return RecommendationResponse(
                 tracks=llm_response.get('recommendations', [])[:request.max_results],
@@ -274,20 +398,28 @@ class HybridMusicSystem:
                 processing_time_ms=0
             )
     
-    async def process_feedback(self, user_id: int, track_id: str, rating: int, feedback_text: str) -> Dict:
-        feedback_data = {
+    async def process_feedback(self, user_id: int, track_id: str, rating: int, feedback_text: str,
+                               track_details: Dict = None) -> Dict:
+        feedback_data = dict(track_details or {})
+        feedback_data.update({
             'user_id': user_id,
             'track_id': track_id,
             'rating': rating,
             'feedback_text': feedback_text,
             'timestamp': datetime.now().isoformat()
-        }
+        })
+        if feedback_data.get('track_name') and feedback_data.get('artist'):
+            feedback_data['feedback_features'] = self.rl_engine.encode_feedback_features(feedback_data)
         
-        self.db_manager.log_feedback(feedback_data)
-        if self._has_sufficient_training_data(user_id):
+        # The DB layer is synchronous; keep its round trips off the event loop
+        await asyncio.to_thread(self.db_manager.log_feedback, feedback_data)
+        # log_feedback swallows write errors, so re-read rather than blindly incrementing
+        self._invalidate_feedback_count(user_id)
+        self._invalidate_llm_responses(user_id)
+        feedback_count = await asyncio.to_thread(self._get_feedback_count, user_id)
+        if feedback_count >= self.config.rl.min_training_samples:
             training_result = await self.rl_engine.update_user_model(user_id)
-            if user_id in self.user_contexts:
-                del self.user_contexts[user_id]
+            self._invalidate_user_context(user_id)
             
             return {
                 'success': True,
@@ -296,7 +428,7 @@ class HybridMusicSystem:
                 'message': 'Thank you! Your feedback helps improve recommendations.'
             }
         else:
-            needed = self.config.rl.min_training_samples - self.db_manager.get_user_feedback_count(user_id)
+            needed = self.config.rl.min_training_samples - feedback_count
             return {
                 'success': True,
                 'model_updated': False,
@@ -304,7 +436,7 @@ class HybridMusicSystem:
             }
     
     def get_ai_status(self, user_id: int) -> Dict:
-        feedback_count = self.db_manager.get_user_feedback_count(user_id)
+        feedback_count = self._get_feedback_count(user_id)
         rl_insights = self.rl_engine.get_user_insights(user_id)
         
         return {
@@ -327,8 +459,8 @@ class HybridMusicSystem:
                 }
             
             result = self.rl_engine.train_user_model(user_id)
-            if user_id in self.user_contexts:
-                del self.user_contexts[user_id]
+            self._invalidate_user_context(user_id)
+            self._invalidate_llm_responses(user_id)
             
             return {
                 'success': result.get('success', False),
@@ -1,16 +1,104 @@
 import sqlite3
-import json
+import copy
+import functools
 import os
+import queue
+import weakref
+from collections import Counter
+from contextlib import contextmanager
 from pathlib import Path
 from typing import Dict, List
 from datetime import datetime
-import numpy as np
-import pandas as pd
+import orjson
+
+# INSERT ... RETURNING needs SQLite 3.35+
+_SUPPORTS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+def _to_json(obj) -> str:
+    """Serialize with orjson, stored as TEXT like the existing rows"""
+    return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+
+def _with_conn(default, action: str):
+    """Run a DatabaseManager method on a pooled connection inside one transaction.
+    
+    The method takes the connection as its first argument after self. Any error
+    is printed as "Error <action>: ..." and a fresh copy of `default` returned.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(self, *args, **kwargs):
+            try:
+                with self.acquire() as conn:
+                    return fn(self, conn, *args, **kwargs)
+            except Exception as e:
+                print(f"Error {action}: {e}")
+                return copy.deepcopy(default)
+        return wrapper
+    return decorator
+
+class ConnectionPool:
+    """Bounded pool of pre-opened SQLite connections shared across threads"""
+    
+    PRAGMAS = (
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        "PRAGMA temp_store=MEMORY",
+        "PRAGMA cache_size=-20000",
+        "PRAGMA mmap_size=268435456",
+        "PRAGMA wal_autocheckpoint=1000",
+        "PRAGMA busy_timeout=5000",
+    )
+    # Every query text the manager and services issue stays prepared on each connection
+    STATEMENT_CACHE_SIZE = 128
+    
+    def __init__(self, db_path: str, pool_size: int = 8, timeout: float = 5):
+        self.db_path = db_path
+        self.timeout = timeout
+        # LIFO hands back the most recently used connection, whose page cache is warmest
+        self._connections = queue.LifoQueue(maxsize=pool_size)
+        for _ in range(pool_size):
+            self._connections.put(self._open())
+    
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.db_path, check_same_thread=False, cached_statements=self.STATEMENT_CACHE_SIZE
+        )
+        for pragma in self.PRAGMAS:
+            conn.execute(pragma)
+        return conn
+    
+    @contextmanager
+    def acquire(self):
+        try:
+            conn = self._connections.get(timeout=self.timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError(
+                f"Timed out after {self.timeout}s waiting for a database connection"
+            )
+        try:
+            # Same commit/rollback semantics as `with sqlite3.connect(...)`
+            with conn:
+                yield conn
+        finally:
+            self._connections.put(conn)
+    
+    def close(self):
+        while True:
+            try:
+                conn = self._connections.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                # Refresh planner statistics for the queries this connection ran, as SQLite advises on close
+                conn.execute("PRAGMA optimize")
+            except sqlite3.Error:
+                pass
+            conn.close()
 
 class DatabaseManager:
     """Enhanced database manager with RL-specific operations"""
     
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, pool_size: int = 8, pool_timeout: float = 5):
         self.db_path = db_path
         db_dir = os.path.dirname(self.db_path)
         if db_dir and not os.path.exists(db_dir):
@@ -23,464 +111,553 @@ class DatabaseManager:
             self.db_path = "music_app.db"
             print(f"Using fallback database path: {self.db_path}")
         
+        self.pool = ConnectionPool(self.db_path, pool_size, pool_timeout)
+        weakref.finalize(self, self.pool.close)
         self.init_database()
     
+    def acquire(self):
+        """Borrow a pooled connection: `with db_manager.acquire() as conn:`"""
+        return self.pool.acquire()
+    
+    def close(self):
+        self.pool.close()
+    
+    _REBUILD_FEEDBACK_AGG = '''
+        INSERT OR REPLACE INTO user_feedback_agg
+        (user_id, total_feedback, rating_sum, rating_sq_sum, positive_count, negative_count, updated_at)
+        SELECT user_id, COUNT(*), SUM(rating), SUM(rating * rating),
+               SUM(rating >= 4), SUM(rating <= 2), CURRENT_TIMESTAMP
+        FROM feedback
+        GROUP BY user_id;
+    '''
+    
+    _TOP_HIGH_RATED_TAGS = '''
+        SELECT ft.tag, COUNT(*) FROM feedback_tag ft
+        JOIN feedback f ON f.id = ft.feedback_id
+        WHERE f.user_id = ? AND f.rating >= 4 {position_filter}
+        GROUP BY ft.tag
+        ORDER BY COUNT(*) DESC, MIN(ft.feedback_id), MIN(ft.position)
+        LIMIT 5
+    '''
+    
+    _SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            email TEXT UNIQUE,
+            full_name TEXT,
+            password_hash TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_login TIMESTAMP,
+            preferences TEXT DEFAULT '{}',
+            settings TEXT DEFAULT '{}'
+        );
+        CREATE TABLE IF NOT EXISTS interactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            query TEXT NOT NULL,
+            enhanced_query TEXT,
+            recommendations TEXT,
+            mood_analysis TEXT,
+            musical_context TEXT,
+            rl_enhanced BOOLEAN DEFAULT FALSE,
+            hybrid_score REAL,
+            processing_time_ms INTEGER,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        );
+        CREATE TABLE IF NOT EXISTS feedback (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            interaction_id INTEGER,
+            track_id TEXT NOT NULL,
+            track_name TEXT NOT NULL,
+            artist TEXT NOT NULL,
+            album TEXT,
+            rating INTEGER NOT NULL CHECK (rating >= 1 AND rating <= 5),
+            predicted_rating REAL,
+            rl_confidence REAL,
+            feedback_text TEXT,
+            track_features TEXT,
+            track_tags TEXT,
+            context_data TEXT,
+            source TEXT,
+            popularity INTEGER,
+            relevance_score REAL,
+            energy REAL,
+            feedback_features BLOB,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (interaction_id) REFERENCES interactions (id)
+        );
+        -- Per-user feedback aggregates, kept current by the feedback_agg_ins trigger
+        CREATE TABLE IF NOT EXISTS user_feedback_agg (
+            user_id INTEGER PRIMARY KEY,
+            total_feedback INTEGER NOT NULL DEFAULT 0,
+            rating_sum REAL NOT NULL DEFAULT 0,
+            rating_sq_sum REAL NOT NULL DEFAULT 0,
+            positive_count INTEGER NOT NULL DEFAULT 0,
+            negative_count INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        );
+        -- Runs inside the inserting transaction, so the aggregates can never drift from feedback
+        CREATE TRIGGER IF NOT EXISTS feedback_agg_ins AFTER INSERT ON feedback
+        BEGIN
+            INSERT INTO user_feedback_agg
+            (user_id, total_feedback, rating_sum, rating_sq_sum, positive_count, negative_count)
+            VALUES (NEW.user_id, 1, NEW.rating, NEW.rating * NEW.rating, NEW.rating >= 4, NEW.rating <= 2)
+            ON CONFLICT(user_id) DO UPDATE SET
+                total_feedback = total_feedback + 1,
+                rating_sum = rating_sum + excluded.rating_sum,
+                rating_sq_sum = rating_sq_sum + excluded.rating_sq_sum,
+                positive_count = positive_count + excluded.positive_count,
+                negative_count = negative_count + excluded.negative_count,
+                updated_at = CURRENT_TIMESTAMP;
+        END;
+        -- Normalized copy of feedback.track_tags so tag counts can be done in SQL
+        CREATE TABLE IF NOT EXISTS feedback_tag (
+            feedback_id INTEGER NOT NULL,
+            tag TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            PRIMARY KEY (feedback_id, position),
+            FOREIGN KEY (feedback_id) REFERENCES feedback (id)
+        );
+        CREATE TABLE IF NOT EXISTS user_model_performance (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            model_accuracy REAL,
+            mae REAL,
+            rmse REAL,
+            cv_score REAL,
+            training_samples INTEGER,
+            feature_importance TEXT,
+            model_version TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        );
+        -- Deleting a user removes their rows everywhere in the same statement; a trigger rather
+        -- than ON DELETE CASCADE so databases created before it need no table rebuild
+        CREATE TRIGGER IF NOT EXISTS users_del BEFORE DELETE ON users
+        BEGIN
+            DELETE FROM feedback_tag WHERE feedback_id IN (SELECT id FROM feedback WHERE user_id = OLD.id);
+            DELETE FROM feedback WHERE user_id = OLD.id;
+            DELETE FROM user_feedback_agg WHERE user_id = OLD.id;
+            DELETE FROM interactions WHERE user_id = OLD.id;
+            DELETE FROM user_model_performance WHERE user_id = OLD.id;
+        END;
+    '''
+    
+    _INDEXES = '''
+        CREATE INDEX IF NOT EXISTS idx_interactions_user_timestamp ON interactions(user_id, timestamp);
+        -- (user_id, rating, timestamp) covers the old (user_id, rating) prefix as well
+        DROP INDEX IF EXISTS idx_feedback_user_rating;
+        CREATE INDEX IF NOT EXISTS idx_feedback_user_rating_ts ON feedback(user_id, rating, timestamp DESC);
+        CREATE INDEX IF NOT EXISTS idx_feedback_user_timestamp ON feedback(user_id, timestamp DESC);
+        CREATE INDEX IF NOT EXISTS idx_feedback_timestamp ON feedback(timestamp);
+        CREATE INDEX IF NOT EXISTS idx_model_performance_user ON user_model_performance(user_id);
+    '''
+    
+    # energy is denormalized out of track_features so it can be averaged in SQL
+    _ADD_FEEDBACK_ENERGY = '''
+        ALTER TABLE feedback ADD COLUMN energy REAL;
+        UPDATE feedback
+        SET energy = COALESCE(json_extract(track_features, '$.energy'), 0.5)
+        WHERE json_valid(track_features) AND json_type(track_features) = 'object';
+    '''
+    
+    # float32 feature row computed when the rating is logged; older rows stay NULL
+    _ADD_FEEDBACK_FEATURES = '''
+        ALTER TABLE feedback ADD COLUMN feedback_features BLOB;
+    '''
+    
+    _BACKFILL_FEEDBACK_TAGS = '''
+        INSERT INTO feedback_tag (feedback_id, tag, position)
+        SELECT f.id, j.value, j.key
+        FROM feedback f, json_each(f.track_tags) j
+        WHERE json_valid(f.track_tags) AND json_type(f.track_tags) = 'array'
+          AND j.type = 'text';
+    '''
+    
     def init_database(self):
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("PRAGMA foreign_keys = ON")
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS users (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        username TEXT UNIQUE NOT NULL,
-                        email TEXT UNIQUE,
-                        full_name TEXT,
-                        password_hash TEXT NOT NULL,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        last_login TIMESTAMP,
-                        preferences TEXT DEFAULT '{}',
-                        settings TEXT DEFAULT '{}'
-                    )
-                ''')
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS interactions (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        user_id INTEGER NOT NULL,
-                        query TEXT NOT NULL,
-                        enhanced_query TEXT,
-                        recommendations TEXT,
-                        mood_analysis TEXT,
-                        musical_context TEXT,
-                        rl_enhanced BOOLEAN DEFAULT FALSE,
-                        hybrid_score REAL,
-                        processing_time_ms INTEGER,
-                        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (user_id) REFERENCES users (id)
-                    )
-                ''')
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS feedback (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        user_id INTEGER NOT NULL,
-                        interaction_id INTEGER,
-                        track_id TEXT NOT NULL,
-                        track_name TEXT NOT NULL,
-                        artist TEXT NOT NULL,
-                        album TEXT,
-                        rating INTEGER NOT NULL CHECK (rating >= 1 AND rating <= 5),
-                        predicted_rating REAL,
-                        rl_confidence REAL,
-                        feedback_text TEXT,
-                        track_features TEXT,
-                        track_tags TEXT,
-                        context_data TEXT,
-                        source TEXT,
-                        popularity INTEGER,
-                        relevance_score REAL,
-                        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (user_id) REFERENCES users (id),
-                        FOREIGN KEY (interaction_id) REFERENCES interactions (id)
-                    )
-                ''')
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS user_model_performance (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        user_id INTEGER NOT NULL,
-                        model_accuracy REAL,
-                        mae REAL,
-                        rmse REAL,
-                        cv_score REAL,
-                        training_samples INTEGER,
-                        feature_importance TEXT,
-                        model_version TEXT,
-                        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (user_id) REFERENCES users (id)
-                    )
-                ''')
-                
-                indexes = [
-                    "CREATE INDEX IF NOT EXISTS idx_interactions_user_timestamp ON interactions(user_id, timestamp)",
-                    "CREATE INDEX IF NOT EXISTS idx_feedback_user_rating ON feedback(user_id, rating)",
-                    "CREATE INDEX IF NOT EXISTS idx_feedback_timestamp ON feedback(timestamp)",
-                    "CREATE INDEX IF NOT EXISTS idx_model_performance_user ON user_model_performance(user_id)"
-                ]
-                
-                for index in indexes:
-                    cursor.execute(index)
-                
-                conn.commit()
+            # No PRAGMA foreign_keys: it is per connection, and the users_del trigger does the
+            # cascade; enforcing it would also reject feedback whose interaction row is still queued
+            with self.acquire() as conn:
+                existing_tables = {
+                    row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+                }
+                feedback_columns = {row[1] for row in conn.execute("PRAGMA table_info(feedback)")}
+                
+                # One-off migrations for databases created before these tables/columns existed
+                migrations = []
+                if 'feedback' in existing_tables and 'energy' not in feedback_columns:
+                    migrations.append(self._ADD_FEEDBACK_ENERGY)
+                if 'feedback' in existing_tables and 'feedback_features' not in feedback_columns:
+                    migrations.append(self._ADD_FEEDBACK_FEATURES)
+                if 'user_feedback_agg' not in existing_tables:
+                    migrations.append(self._REBUILD_FEEDBACK_AGG)
+                if 'feedback_tag' not in existing_tables:
+                    migrations.append(self._BACKFILL_FEEDBACK_TAGS)
+                
+                # The whole schema and its migrations apply atomically, or not at all
+                conn.executescript(
+                    'BEGIN IMMEDIATE;' + self._SCHEMA + ''.join(migrations) + self._INDEXES + 'COMMIT;'
+                )
                 print(f"✅ Database initialized successfully at: {self.db_path}")
                 
         except Exception as e:
             print(f"❌ Error initializing database: {e}")
             raise
     
-    def get_user_feedback_with_context(self, user_id: int) -> List[Dict]:
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                query = '''
-                    SELECT f.*, i.mood_analysis, i.musical_context
-                    FROM feedback f
-                    LEFT JOIN interactions i ON f.interaction_id = i.id
-                    WHERE f.user_id = ?
-                    ORDER BY f.timestamp DESC
-                '''
-                
-                cursor.execute(query, (user_id,))
-                columns = [description[0] for description in cursor.description]
-                rows = cursor.fetchall()
-                
-                return [dict(zip(columns, row)) for row in rows]
-        except Exception as e:
-            print(f"Error getting user feedback: {e}")
-            return []
+    @_with_conn(default=[], action="getting user feedback")
+    def get_user_feedback_with_context(self, conn: sqlite3.Connection, user_id: int) -> List[Dict]:
+        cursor = conn.cursor()
+        
+        query = '''
+            SELECT f.*, i.mood_analysis, i.musical_context
+            FROM feedback f
+            LEFT JOIN interactions i ON f.interaction_id = i.id
+            WHERE f.user_id = ?
+            ORDER BY f.timestamp DESC
+        '''
+        
+        cursor.row_factory = sqlite3.Row
+        cursor.execute(query, (user_id,))
+        
+        return [dict(row) for row in cursor.fetchall()]
     
-    def get_user_feedback_count(self, user_id: int) -> int:
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("SELECT COUNT(*) FROM feedback WHERE user_id = ?", (user_id,))
-                return cursor.fetchone()[0]
-        except Exception as e:
-            print(f"Error getting feedback count: {e}")
-            return 0
+    @_with_conn(default=0, action="getting feedback count")
+    def get_user_feedback_count(self, conn: sqlite3.Connection, user_id: int) -> int:
+        # Primary-key read of the aggregate row instead of COUNT(*) over feedback
+        row = conn.execute(
+            "SELECT total_feedback FROM user_feedback_agg WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return row[0] if row else 0
     
-    def update_user_model_stats(self, user_id: int, stats: Dict):
+    @_with_conn(default=None, action="updating model stats")
+    def update_user_model_stats(self, conn: sqlite3.Connection, user_id: int, stats: Dict):
         """Update user model performance statistics"""
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                cursor.execute('''
-                    INSERT INTO user_model_performance 
-                    (user_id, model_accuracy, training_samples, timestamp)
-                    VALUES (?, ?, ?, ?)
-                ''', (
-                    user_id,
-                    stats.get('model_accuracy', 0),
-                    stats.get('training_samples', 0),
-                    datetime.now()
-                ))
-                
-                conn.commit()
-        except Exception as e:
-            print(f"Error updating model stats: {e}")
+        conn.execute('''
+            INSERT INTO user_model_performance 
+            (user_id, model_accuracy, training_samples, timestamp)
+            VALUES (?, ?, ?, ?)
+        ''', (
+            user_id,
+            stats.get('model_accuracy', 0),
+            stats.get('training_samples', 0),
+            datetime.now()
+        ))
     
-    def get_user_preference_patterns(self, user_id: int) -> Dict:
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                high_rated_df = pd.read_sql_query('''
-                    SELECT artist, track_tags, rating, track_features
-                    FROM feedback 
-                    WHERE user_id = ? AND rating >= 4
-                ''', 'sqlite:///'+self.db_path, params=(user_id,))
-                
-                patterns = {}
-                
-                if len(high_rated_df) > 0:
-                    patterns['preferred_artists'] = high_rated_df['artist'].value_counts().head(5).index.tolist()
-                    all_tags = []
-                    for tags_json in high_rated_df['track_tags'].dropna():
-                        try:
-                            if tags_json: 
-                                tags = json.loads(tags_json)
-                                all_tags.extend(tags)
-                        except (json.JSONDecodeError, TypeError):
-                            continue
-                    
-                    if all_tags:
-                        tag_counts = pd.Series(all_tags).value_counts()
-                        patterns['preferred_genres'] = tag_counts.head(5).index.tolist()
-                    
-                    energy_values = []
-                    for features_json in high_rated_df['track_features'].dropna():
-                        try:
-                            if features_json:  
-                                features = json.loads(features_json)
-                                energy_values.append(features.get('energy', 0.5))
-                        except (json.JSONDecodeError, TypeError):
-                            continue
-                    
-                    if energy_values:
-                        patterns['average_energy'] = np.mean(energy_values)
-                
-                return patterns
-                
-        except Exception as e:
-            print(f"Error getting preference patterns: {e}")
-            return {}
+    @_with_conn(default={}, action="getting preference patterns")
+    def get_user_preference_patterns(self, conn: sqlite3.Connection, user_id: int) -> Dict:
+        preferred_artists = [row[0] for row in conn.execute('''
+            SELECT artist FROM feedback
+            WHERE user_id = ? AND rating >= 4 AND artist IS NOT NULL
+            GROUP BY artist
+            ORDER BY COUNT(*) DESC, MIN(id)
+            LIMIT 5
+        ''', (user_id,))]
+        preferred_genres = [row[0] for row in conn.execute(self._TOP_HIGH_RATED_TAGS.format(
+            position_filter=''
+        ), (user_id,))]
+        high_rated_count, average_energy = conn.execute('''
+            SELECT COUNT(*), AVG(energy)
+            FROM feedback 
+            WHERE user_id = ? AND rating >= 4
+        ''', (user_id,)).fetchone()
+        
+        patterns = {}
+        
+        if high_rated_count > 0:
+            patterns['preferred_artists'] = preferred_artists
+            if preferred_genres:
+                patterns['preferred_genres'] = preferred_genres
+            if average_energy is not None:
+                patterns['average_energy'] = average_energy
+        
+        return patterns
     
-    def get_user_feedback_analysis(self, user_id: int) -> Dict:
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                feedback_df = pd.read_sql_query('''
-                    SELECT * FROM feedback WHERE user_id = ?
-                ''', 'sqlite:///'+self.db_path, params=(user_id,))
-                
-                if len(feedback_df) == 0:
-                    return {}
-                
-                analysis = {}
-                analysis['rating_distribution'] = feedback_df['rating'].value_counts().to_dict()
-                analysis['average_rating'] = feedback_df['rating'].mean()
-                high_rated = feedback_df[feedback_df['rating'] >= 4]
-                
-                if len(high_rated) > 0:
-                    analysis['top_artists'] = high_rated['artist'].value_counts().head(5).to_dict()
-                    all_genres = []
-                    for tags_json in high_rated['track_tags'].dropna():
-                        try:
-                            if tags_json:  
-                                tags = json.loads(tags_json)
-                                all_genres.extend(tags[:3]) 
-                        except (json.JSONDecodeError, TypeError):
-                            continue
-                    
-                    if all_genres:
-                        genre_counts = pd.Series(all_genres).value_counts()
-                        analysis['top_genres'] = genre_counts.head(5).to_dict()
-                
-                analysis['recommendation_stats'] = {
-                    'total_ratings': len(feedback_df),
-                    'positive_ratings': len(feedback_df[feedback_df['rating'] >= 4]),
-                    'negative_ratings': len(feedback_df[feedback_df['rating'] <= 2]),
-                    'rating_variance': feedback_df['rating'].var()
-                }
-                
-                return analysis
-                
-        except Exception as e:
-            print(f"Error getting feedback analysis: {e}")
+    @_with_conn(default={}, action="getting feedback analysis")
+    def get_user_feedback_analysis(self, conn: sqlite3.Connection, user_id: int) -> Dict:
+        total, rated, rating_sum, rating_sq_sum, positive, negative = conn.execute('''
+            SELECT COUNT(*), COUNT(rating), SUM(rating), SUM(rating * rating),
+                   SUM(rating >= 4), SUM(rating <= 2)
+            FROM feedback WHERE user_id = ?
+        ''', (user_id,)).fetchone()
+        
+        if total == 0:
             return {}
+        
+        rating_distribution = dict(conn.execute('''
+            SELECT rating, COUNT(*) FROM feedback
+            WHERE user_id = ?
+            GROUP BY rating
+            ORDER BY COUNT(*) DESC
+        ''', (user_id,)).fetchall())
+        top_artists = dict(conn.execute('''
+            SELECT artist, COUNT(*) FROM feedback
+            WHERE user_id = ? AND rating >= 4 AND artist IS NOT NULL
+            GROUP BY artist
+            ORDER BY COUNT(*) DESC, MIN(id)
+            LIMIT 5
+        ''', (user_id,)).fetchall())
+        # Only each track's first three tags count towards its genres
+        top_genres = dict(conn.execute(self._TOP_HIGH_RATED_TAGS.format(
+            position_filter='AND ft.position < 3'
+        ), (user_id,)).fetchall())
+        
+        analysis = {}
+        analysis['rating_distribution'] = rating_distribution
+        analysis['average_rating'] = rating_sum / rated if rated else float('nan')
+        
+        if positive:
+            analysis['top_artists'] = top_artists
+            if top_genres:
+                analysis['top_genres'] = top_genres
+        
+        # Sample variance, matching pandas' ddof=1 default
+        if rated > 1:
+            rating_variance = (rating_sq_sum - rating_sum * rating_sum / rated) / (rated - 1)
+        else:
+            rating_variance = float('nan')
+        analysis['recommendation_stats'] = {
+            'total_ratings': total,
+            'positive_ratings': positive,
+            'negative_ratings': negative,
+            'rating_variance': rating_variance
+        }
+        
+        return analysis
     
-    def get_user_temporal_patterns(self, user_id: int) -> Dict:
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                interactions_df = pd.read_sql_query('''
-                    SELECT timestamp FROM interactions WHERE user_id = ?
-                ''', 'sqlite:///'+self.db_path, params=(user_id,))
-                
-                if len(interactions_df) == 0:
-                    return {}
-                
-                interactions_df['timestamp'] = pd.to_datetime(interactions_df['timestamp'])
-                interactions_df['hour'] = interactions_df['timestamp'].dt.hour
-                interactions_df['day_of_week'] = interactions_df['timestamp'].dt.day_name()
-                
-                patterns = {
-                    'hourly_activity': interactions_df['hour'].value_counts().to_dict(),
-                    'daily_activity': interactions_df['day_of_week'].value_counts().to_dict(),
-                    'peak_hour': interactions_df['hour'].mode()[0] if len(interactions_df) > 0 else 12,
-                    'peak_day': interactions_df['day_of_week'].mode()[0] if len(interactions_df) > 0 else 'Monday'
-                }
-                
-                return patterns
-                
-        except Exception as e:
-            print(f"Error getting temporal patterns: {e}")
+    # strftime('%w') numbering: 0 is Sunday
+    _DAY_NAMES = ('Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday')
+    
+    @_with_conn(default={}, action="getting temporal patterns")
+    def get_user_temporal_patterns(self, conn: sqlite3.Connection, user_id: int) -> Dict:
+        rows = conn.execute('''
+            SELECT CAST(strftime('%H', timestamp) AS INTEGER) AS hour,
+                   CAST(strftime('%w', timestamp) AS INTEGER) AS dow,
+                   COUNT(*)
+            FROM interactions
+            WHERE user_id = ? AND strftime('%H', timestamp) IS NOT NULL
+            GROUP BY hour, dow
+        ''', (user_id,)).fetchall()
+        
+        if not rows:
             return {}
+        
+        hourly_activity = Counter()
+        daily_activity = Counter()
+        for hour, dow, count in rows:
+            hourly_activity[hour] += count
+            daily_activity[self._DAY_NAMES[dow]] += count
+        
+        return {
+            'hourly_activity': dict(hourly_activity.most_common()),
+            'daily_activity': dict(daily_activity.most_common()),
+            'peak_hour': self._mode(hourly_activity),
+            'peak_day': self._mode(daily_activity)
+        }
+    
+    @staticmethod
+    def _mode(counts: Counter):
+        """Most frequent key, smallest first on ties like pandas' Series.mode()[0]"""
+        top = max(counts.values())
+        return min(key for key, count in counts.items() if count == top)
     
-    def get_user_model_performance_history(self, user_id: int) -> List[Dict]:
+    @_with_conn(default=[], action="getting performance history")
+    def get_user_model_performance_history(self, conn: sqlite3.Connection, user_id: int) -> List[Dict]:
         """Get historical model performance data"""
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                cursor.execute('''
-                    SELECT model_accuracy, timestamp 
-                    FROM user_model_performance 
-                    WHERE user_id = ? 
-                    ORDER BY timestamp
-                ''', (user_id,))
-                
-                rows = cursor.fetchall()
-                
-                return [
-                    {'accuracy': row[0], 'timestamp': row[1]} 
-                    for row in rows
-                ]
-        except Exception as e:
-            print(f"Error getting performance history: {e}")
-            return []
+        rows = conn.execute('''
+            SELECT model_accuracy, timestamp 
+            FROM user_model_performance 
+            WHERE user_id = ? 
+            ORDER BY timestamp
+        ''', (user_id,)).fetchall()
+        
+        return [
+            {'accuracy': row[0], 'timestamp': row[1]} 
+            for row in rows
+        ]
     
-    def log_interaction(self, interaction_data: Dict):
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                cursor.execute('''
-                    INSERT INTO interactions 
-                    (user_id, query, enhanced_query, recommendations, mood_analysis, 
-                     musical_context, rl_enhanced, hybrid_score, processing_time_ms)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    interaction_data['user_id'],
-                    interaction_data['query'],
-                    interaction_data.get('enhanced_query'),
-                    json.dumps(interaction_data.get('recommendations', [])),
-                    json.dumps(interaction_data.get('mood_analysis', {})),
-                    json.dumps(interaction_data.get('musical_context', {})),
-                    interaction_data.get('rl_enhanced', False),
-                    interaction_data.get('hybrid_score', 0),
-                    interaction_data.get('processing_time_ms', 0)
-                ))
-                
-                conn.commit()
-                return cursor.lastrowid
-        except Exception as e:
-            print(f"Error logging interaction: {e}")
-            return None
+    _INSERT_INTERACTION = '''
+        INSERT INTO interactions 
+        (user_id, query, enhanced_query, recommendations, mood_analysis, 
+         musical_context, rl_enhanced, hybrid_score, processing_time_ms)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    '''
     
-    def log_feedback(self, feedback_data: Dict):
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                cursor.execute('''
-                    INSERT INTO feedback 
-                    (user_id, interaction_id, track_id, track_name, artist, rating, 
-                     predicted_rating, rl_confidence, feedback_text, track_features, 
-                     track_tags, context_data, source, popularity, relevance_score)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    feedback_data['user_id'],
-                    feedback_data.get('interaction_id'),
-                    feedback_data['track_id'],
-                    feedback_data['track_name'],
-                    feedback_data['artist'],
-                    feedback_data['rating'],
-                    feedback_data.get('predicted_rating'),
-                    feedback_data.get('rl_confidence'),
-                    feedback_data.get('feedback_text'),
-                    json.dumps(feedback_data.get('track_features', {})),
-                    json.dumps(feedback_data.get('track_tags', [])),
-                    json.dumps(feedback_data.get('context_data', {})),
-                    feedback_data.get('source'),
-                    feedback_data.get('popularity'),
-                    feedback_data.get('relevance_score')
-                ))
-                
-                conn.commit()
-        except Exception as e:
-            print(f"Error logging feedback: {e}")
+    _INSERT_INTERACTION_RETURNING = _INSERT_INTERACTION.rstrip() + ' RETURNING id'
     
-    def get_user_data(self, user_id: int) -> Dict:
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
-                row = cursor.fetchone()
-                
-                if row:
-                    columns = [description[0] for description in cursor.description]
-                    return dict(zip(columns, row))
-                return {}
-        except Exception as e:
-            print(f"Error getting user data: {e}")
-            return {}
+    @staticmethod
+    def _interaction_row(interaction_data: Dict) -> tuple:
+        return (
+            interaction_data['user_id'],
+            interaction_data['query'],
+            interaction_data.get('enhanced_query'),
+            _to_json(interaction_data.get('recommendations', [])),
+            _to_json(interaction_data.get('mood_analysis', {})),
+            _to_json(interaction_data.get('musical_context', {})),
+            interaction_data.get('rl_enhanced', False),
+            interaction_data.get('hybrid_score', 0),
+            interaction_data.get('processing_time_ms', 0)
+        )
     
-    def get_recent_interactions(self, user_id: int, limit: int = 10) -> List[Dict]:
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                cursor.execute('''
-                    SELECT * FROM interactions 
-                    WHERE user_id = ? 
-                    ORDER BY timestamp DESC 
-                    LIMIT ?
-                ''', (user_id, limit))
-                
-                columns = [description[0] for description in cursor.description]
-                rows = cursor.fetchall()
-                
-                return [dict(zip(columns, row)) for row in rows]
-        except Exception as e:
-            print(f"Error getting recent interactions: {e}")
+    def log_interaction(self, interaction_data: Dict):
+        """Insert one interaction; returns its id, or None if it wasn't written"""
+        ids = self.log_interactions_batch([interaction_data])
+        return ids[0] if ids else None
+    
+    def log_interactions_batch(self, interactions: List[Dict]) -> List[int]:
+        """Insert many interactions in one transaction; returns their ids in order, [] on failure"""
+        if not interactions:
             return []
+        return self._insert_interactions(interactions)
     
-    def get_user_stats(self, user_id: int) -> Dict:
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT COUNT(*) FROM interactions WHERE user_id = ?', (user_id,))
-                total_interactions = cursor.fetchone()[0]
-                cursor.execute('SELECT COUNT(*) FROM feedback WHERE user_id = ?', (user_id,))
-                total_feedback = cursor.fetchone()[0]
-                cursor.execute('SELECT AVG(rating) FROM feedback WHERE user_id = ?', (user_id,))
-                avg_rating_result = cursor.fetchone()
-                average_rating = avg_rating_result[0] if avg_rating_result[0] else 0
-                cursor.execute('''
-                    SELECT track_name, artist, rating, timestamp
-                    FROM feedback 
-                    WHERE user_id = ? AND rating >= 4
-                    ORDER BY timestamp DESC
-                    LIMIT 5
-                ''', (user_id,))
-                
-                recent_high_rated = [
-                    {
-                        'track_name': row[0],
-                        'artist': row[1],
-                        'rating': row[2],
-                        'timestamp': row[3]
-                    }
-                    for row in cursor.fetchall()
-                ]
-                return {
-                    'total_interactions': total_interactions,
-                    'total_feedback': total_feedback,
-                    'average_rating': average_rating,
-                    'recent_high_rated': recent_high_rated
-                }
-        except Exception as e:
-            print(f"Error getting user stats: {e}")
-            return {
-                'total_interactions': 0,
-                'total_feedback': 0,
-                'average_rating': 0,
-                'recent_high_rated': []
+    @_with_conn(default=[], action="logging interaction batch")
+    def _insert_interactions(self, conn: sqlite3.Connection, interactions: List[Dict]) -> List[int]:
+        # Row by row so each id can be read back; still a single transaction
+        if _SUPPORTS_RETURNING:
+            return [
+                conn.execute(self._INSERT_INTERACTION_RETURNING, self._interaction_row(data)).fetchone()[0]
+                for data in interactions
+            ]
+        return [
+            conn.execute(self._INSERT_INTERACTION, self._interaction_row(data)).lastrowid
+            for data in interactions
+        ]
+    
+    _INSERT_FEEDBACK = '''
+        INSERT INTO feedback 
+        (user_id, interaction_id, track_id, track_name, artist, rating, 
+         predicted_rating, rl_confidence, feedback_text, track_features, 
+         track_tags, context_data, source, popularity, relevance_score, energy,
+         feedback_features)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    '''
+    
+    @staticmethod
+    def _feedback_row(feedback_data: Dict) -> tuple:
+        return (
+            feedback_data['user_id'],
+            feedback_data.get('interaction_id'),
+            feedback_data['track_id'],
+            feedback_data['track_name'],
+            feedback_data['artist'],
+            feedback_data['rating'],
+            feedback_data.get('predicted_rating'),
+            feedback_data.get('rl_confidence'),
+            feedback_data.get('feedback_text'),
+            _to_json(feedback_data.get('track_features', {})),
+            _to_json(feedback_data.get('track_tags', [])),
+            _to_json(feedback_data.get('context_data', {})),
+            feedback_data.get('source'),
+            feedback_data.get('popularity'),
+            feedback_data.get('relevance_score'),
+            (feedback_data.get('track_features') or {}).get('energy', 0.5),
+            feedback_data.get('feedback_features')
+        )
+    
+    @staticmethod
+    def _insert_feedback_tags(cursor: sqlite3.Cursor, feedback_id: int, feedback_data: Dict):
+        tags = feedback_data.get('track_tags') or []
+        # Same rule as _BACKFILL_FEEDBACK_TAGS: only text tags, at their index in the original list
+        rows = [(feedback_id, tag, position) for position, tag in enumerate(tags) if isinstance(tag, str)]
+        if rows:
+            cursor.executemany(
+                "INSERT INTO feedback_tag (feedback_id, tag, position) VALUES (?, ?, ?)",
+                rows
+            )
+    
+    @_with_conn(default=None, action="logging feedback")
+    def log_feedback(self, conn: sqlite3.Connection, feedback_data: Dict):
+        cursor = conn.cursor()
+        cursor.execute(self._INSERT_FEEDBACK, self._feedback_row(feedback_data))
+        self._insert_feedback_tags(cursor, cursor.lastrowid, feedback_data)
+    
+    @_with_conn(default={}, action="getting user data")
+    def get_user_data(self, conn: sqlite3.Connection, user_id: int) -> Dict:
+        cursor = conn.cursor()
+        cursor.row_factory = sqlite3.Row
+        cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
+        row = cursor.fetchone()
+        
+        return dict(row) if row else {}
+    
+    @_with_conn(default=[], action="getting recent interactions")
+    def get_recent_interactions(self, conn: sqlite3.Connection, user_id: int, limit: int = 10) -> List[Dict]:
+        cursor = conn.cursor()
+        cursor.row_factory = sqlite3.Row
+        
+        cursor.execute('''
+            SELECT * FROM interactions 
+            WHERE user_id = ? 
+            ORDER BY timestamp DESC 
+            LIMIT ?
+        ''', (user_id, limit))
+        
+        return [dict(row) for row in cursor.fetchall()]
+    
+    @_with_conn(
+        default={'total_interactions': 0, 'total_feedback': 0, 'average_rating': 0, 'recent_high_rated': []},
+        action="getting user stats"
+    )
+    def get_user_stats(self, conn: sqlite3.Connection, user_id: int) -> Dict:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT
+                (SELECT COUNT(*) FROM interactions WHERE user_id = :user_id),
+                COALESCE((SELECT total_feedback FROM user_feedback_agg WHERE user_id = :user_id), 0),
+                (SELECT rating_sum / total_feedback FROM user_feedback_agg WHERE user_id = :user_id)
+        ''', {'user_id': user_id})
+        total_interactions, total_feedback, average_rating = cursor.fetchone()
+        average_rating = average_rating or 0
+        cursor.execute('''
+            SELECT track_name, artist, rating, timestamp
+            FROM feedback 
+            WHERE user_id = ? AND rating IN (4, 5)
+            ORDER BY timestamp DESC
+            LIMIT 5
+        ''', (user_id,))
+        
+        recent_high_rated = [
+            {
+                'track_name': row[0],
+                'artist': row[1],
+                'rating': row[2],
+                'timestamp': row[3]
             }
+            for row in cursor.fetchall()
+        ]
+        return {
+            'total_interactions': total_interactions,
+            'total_feedback': total_feedback,
+            'average_rating': average_rating,
+            'recent_high_rated': recent_high_rated
+        }
+    
+    @_with_conn(default={}, action="getting feedback patterns")
+    def get_feedback_patterns(self, conn: sqlite3.Connection, user_id: int) -> Dict:
+        total_ratings, avg_rating = conn.execute(
+            "SELECT COUNT(*), AVG(rating) FROM feedback WHERE user_id = ?", (user_id,)
+        ).fetchone()
         
-    def get_feedback_patterns(self, user_id: int) -> Dict:
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                feedback_df = pd.read_sql_query('''
-                    SELECT rating, track_tags, artist, timestamp
-                    FROM feedback 
-                    WHERE user_id = ?
-                    ORDER BY timestamp DESC
-                ''', 'sqlite:///'+self.db_path, params=(user_id,))
-                
-                if len(feedback_df) == 0:
-                    return {}
-                
-                patterns = {
-                    'preferred_moods': [],
-                    'avg_rating': feedback_df['rating'].mean(),
-                    'total_ratings': len(feedback_df)
-                }
-                high_rated = feedback_df[feedback_df['rating'] >= 4]
-                if len(high_rated) > 0:
-                    all_tags = []
-                    for tags_json in high_rated['track_tags'].dropna():
-                        try:
-                            if tags_json:
-                                tags = json.loads(tags_json)
-                                all_tags.extend(tags[:2])
-                        except:
-                            continue
-                    
-                    if all_tags:
-                        from collections import Counter
-                        mood_counts = Counter(all_tags)
-                        patterns['preferred_moods'] = list(mood_counts.keys())[:5]
-                
-                return patterns
-                
-        except Exception as e:
-            print(f"Error getting feedback patterns: {e}")
-            return {}
\ No newline at end of file
+        if total_ratings == 0:
+            return {}
+        
+        # First two tags of each high-rated track; ties go to the most recently rated
+        preferred_moods = [row[0] for row in conn.execute('''
+            SELECT ft.tag FROM feedback_tag ft
+            JOIN feedback f ON f.id = ft.feedback_id
+            WHERE f.user_id = ? AND f.rating >= 4 AND ft.position < 2
+            GROUP BY ft.tag
+            ORDER BY COUNT(*) DESC, MAX(f.timestamp) DESC
+            LIMIT 5
+        ''', (user_id,))]
+        
+        return {
+            'preferred_moods': preferred_moods,
+            'avg_rating': avg_rating,
+            'total_ratings': total_ratings
+        }
@@ -1,9 +1,15 @@
+import bisect
 from datetime import datetime
 import numpy as np
 import pandas as pd
 import json
 
 class LLMRLIntegrator:
+    # Average energy <= 0.4 is low, <= 0.7 moderate, above that high
+    _ENERGY_THRESHOLDS = (0.4, 0.7)
+    _ENERGY_PARTS = ("Prefers low-energy music", "Prefers moderate-energy music", "Prefers high-energy music")
+    _PERSONALIZATION_HEADER = "\n\nPersonalization Context (learned from user behavior): "
+    
     def __init__(self, config):
         self.config = config
     
@@ -11,6 +17,9 @@ class LLMRLIntegrator:
         if not rl_insights.get('model_exists', False):
             return base_prompt
         
+        return base_prompt + self._build_prompt_enhancement(rl_insights)
+    
+    def _build_prompt_enhancement(self, rl_insights) -> str:
         preferences = rl_insights.get('preference_patterns', {})
         
         enhancement_parts = []
@@ -24,8 +33,7 @@ class LLMRLIntegrator:
         
         if 'average_energy' in preferences:
             energy = preferences['average_energy']
-            energy_desc = "high-energy" if energy > 0.7 else "moderate-energy" if energy > 0.4 else "low-energy"
-            enhancement_parts.append(f"Prefers {energy_desc} music")
+            enhancement_parts.append(self._ENERGY_PARTS[bisect.bisect_left(self._ENERGY_THRESHOLDS, energy)])
         
         if 'temporal_preferences' in preferences:
             current_hour = datetime.now().hour
@@ -38,12 +46,8 @@ class LLMRLIntegrator:
             enhancement_parts.append(f"Often seeks {' and '.join(common_moods)} vibes")
         
         if enhancement_parts:
-            enhancement = f"\n\nPersonalization Context (learned from user behavior): {'; '.join(enhancement_parts)}"
-            enhanced_prompt = base_prompt + enhancement
-        else:
-            enhanced_prompt = base_prompt
-        
-        return enhanced_prompt
+            return self._PERSONALIZATION_HEADER + '; '.join(enhancement_parts)
+        return ""
     
     def combine_llm_rl_scores(self, llm_score: float, rl_score: float, rl_confidence: float) -> float:
         if rl_confidence > 0.8:
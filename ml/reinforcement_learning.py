@@ -1,108 +1,219 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import time
 from datetime import datetime
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 import numpy as np
 import pandas as pd
-import json
+import orjson
 import pickle
 import os
-from sklearn.ensemble import RandomForestRegressor
+import joblib
+from sklearn.ensemble import HistGradientBoostingRegressor, RandomForestRegressor
+from sklearn.inspection import permutation_importance
 from sklearn.preprocessing import StandardScaler
 from sklearn.model_selection import cross_val_score, train_test_split
 from sklearn.metrics import mean_absolute_error, mean_squared_error
 import logging
+from cachetools import LRUCache, TTLCache
 
 logger = logging.getLogger(__name__)
 
+# Optional native inference: trained forests are compiled to shared libraries when available
+try:
+    import treelite
+    import tl2cgen
+except ImportError:
+    treelite = tl2cgen = None
+
+# Column names of a feature row, in ReinforcementLearningEngine.extract_track_features_batch order
+_FEATURE_NAMES = (
+    'energy', 'valence', 'danceability', 'acousticness', 'instrumentalness', 
+    'tempo', 'loudness', 'popularity', 'relevance_score', 'title_length',
+    'has_preview', 'explicit',
+    'source_deezer', 'source_itunes', 'source_lastfm', 'source_musicbrainz', 'source_audiodb',
+    'genre_rock', 'genre_pop', 'genre_electronic', 'genre_jazz', 'genre_classical', 
+    'genre_hip_hop', 'genre_country', 'genre_folk',
+    'hour_normalized', 'is_morning', 'is_afternoon', 'is_evening', 'is_night',
+    'mood_intensity', 'mood_valence', 'mood_arousal',
+    'energy_preference', 'familiarity_preference'
+)
+
 class ReinforcementLearningEngine:
     def __init__(self, config, db_manager):
         self.config = config
         self.db_manager = db_manager
-        self.user_models = {}
-        self.feature_scaler = StandardScaler()
+        # Most recently used user models; the rest stay on disk until asked for
+        self.user_models = LRUCache(maxsize=config.max_cached_models)
+        self._user_models_lock = threading.Lock()
+        # user_id -> (feedback count, preference patterns); patterns only move when feedback does
+        self._preference_patterns = LRUCache(maxsize=1024)
+        self._preference_patterns_lock = threading.Lock()
+        # user_id -> feedback count, so cold users don't hit the database on every prediction burst;
+        # the one count cache for the app, dropped by invalidate_feedback_count when feedback lands
+        self._feedback_counts = TTLCache(maxsize=10_000, ttl=60)
+        self._feedback_counts_lock = threading.Lock()
+        # compiled_path -> loaded tl2cgen.Predictor
+        self._compiled_predictors = LRUCache(maxsize=256)
+        self._compiled_predictors_lock = threading.Lock()
+        # One worker builds libraries off the request path, so compiles never overlap
+        self._compile_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rl-compile")
+        self._compiles_pending = set()
+        self._compiles_pending_lock = threading.Lock()
+        # Serializes model file writes, so a late compile can't overwrite a newer training
+        self._model_files_lock = threading.RLock()
         self.model_dir = "data/models"
         os.makedirs(self.model_dir, exist_ok=True)
         self._load_models()
     
+    def _user_model_path(self, user_id: int) -> str:
+        return os.path.join(self.model_dir, f"user_{user_id}.joblib")
+    
     def _load_models(self):
         try:
-            models_file = os.path.join(self.model_dir, "user_models.pkl")
-            if os.path.exists(models_file):
-                with open(models_file, 'rb') as f:
-                    saved_data = pickle.load(f)
-                    self.user_models = saved_data.get('user_models', {})
-                    self.feature_scaler = saved_data.get('feature_scaler', StandardScaler())
-                logger.info(f"Loaded {len(self.user_models)} user models")
+            self._migrate_legacy_models()
         except Exception as e:
-            logger.error(f"Failed to load models: {e}")
-            self.user_models = {}
+            logger.error("Failed to migrate models: %s", e)
     
-    def _save_models(self):
+    def _get_user_model(self, user_id: int) -> Optional[Dict]:
+        """Cached model, else loaded from its file; None if the user has none yet"""
+        with self._user_models_lock:
+            user_model = self.user_models.get(user_id)
+        if user_model is not None:
+            return user_model
+        
+        models_file = self._user_model_path(user_id)
+        if not os.path.exists(models_file):
+            return None
         try:
-            models_file = os.path.join(self.model_dir, "user_models.pkl")
-            save_data = {
-                'user_models': self.user_models,
-                'feature_scaler': self.feature_scaler,
-                'saved_at': datetime.now().isoformat()
-            }
-            with open(models_file, 'wb') as f:
-                pickle.dump(save_data, f)
-            logger.info("Models saved successfully")
+            user_model = joblib.load(models_file)
         except Exception as e:
-            logger.error(f"Failed to save models: {e}")
+            logger.error("Failed to load model for user %s: %s", user_id, e)
+            return None
+        with self._user_models_lock:
+            self.user_models[user_id] = user_model
+        return user_model
     
-    def extract_track_features(self, track: Dict, context: Dict = None) -> np.ndarray:
-        features = []
-        estimated_features = track.get('estimated_features', {})
-        features.extend([
-            estimated_features.get('energy', 0.5),
-            estimated_features.get('valence', 0.5),
-            estimated_features.get('danceability', 0.5),
-            estimated_features.get('acousticness', 0.3),
-            estimated_features.get('instrumentalness', 0.1),
-            estimated_features.get('tempo', 120) / 200.0,  # Normalize
-            (estimated_features.get('loudness', -8) + 60) / 60.0  # Normalize
-        ])
-        features.extend([
-            track.get('popularity', 0) / 100.0,
-            track.get('relevance_score', 0) / 100.0,
-            len(track.get('name', '')) / 50.0,  # Title length normalized
-            1.0 if track.get('preview_url') else 0.0,
-            1.0 if track.get('explicit') else 0.0
-        ])
-        sources = ['deezer', 'itunes', 'lastfm', 'musicbrainz', 'audiodb']
-        source = track.get('source', 'unknown')
-        features.extend([1.0 if source == s else 0.0 for s in sources])
-        tags = track.get('lastfm_tags', [])
-        common_genres = ['rock', 'pop', 'electronic', 'jazz', 'classical', 'hip-hop', 'country', 'folk']
-        for genre in common_genres:
-            features.append(1.0 if any(genre.lower() in tag.lower() for tag in tags) else 0.0)
-
-        if context:
-            current_hour = datetime.now().hour
-            features.extend([
-                current_hour / 24.0,  
-                1.0 if 6 <= current_hour <= 12 else 0.0,  
-                1.0 if 12 <= current_hour <= 18 else 0.0, 
-                1.0 if 18 <= current_hour <= 24 else 0.0, 
-                1.0 if 0 <= current_hour <= 6 else 0.0,  
-            ])
-            
-            mood_data = context.get('mood_analysis', {})
-            features.extend([
-                mood_data.get('intensity', 0.5),
-                mood_data.get('valence', 0.0),
-                mood_data.get('arousal', 0.5)
-            ])
-            
-            musical_context = context.get('musical_context', {})
-            features.extend([
-                musical_context.get('energy_preference', 0.5),
-                musical_context.get('familiarity_preference', 0.5)
-            ])
+    def _migrate_legacy_models(self):
+        """Split the old all-users pickle into per-user files, once"""
+        legacy_file = os.path.join(self.model_dir, "user_models.pkl")
+        if not os.path.exists(legacy_file):
+            return
+        with open(legacy_file, 'rb') as f:
+            saved_data = pickle.load(f)
+        saved = [
+            self._save_model(user_id, user_model)
+            for user_id, user_model in saved_data.get('user_models', {}).items()
+        ]
+        # Keep the pickle until every user has a file, so a failed write loses nothing
+        if all(saved):
+            os.remove(legacy_file)
         else:
-            features.extend([0.0] * 10)
+            logger.warning("Kept %s: %d of %d user models failed to save",
+                           legacy_file, saved.count(False), len(saved))
+    
+    def _save_model(self, user_id: int, user_model: Dict) -> bool:
+        """Write one user's model; training never rewrites other users' files. True if written"""
+        try:
+            models_file = self._user_model_path(user_id)
+            tmp_file = models_file + ".tmp"
+            with self._model_files_lock:
+                # zlib level 3: numpy-aware dump of the tree arrays, compressed
+                joblib.dump(user_model, tmp_file, compress=3)
+                os.replace(tmp_file, models_file)
+            logger.info("Saved model for user %s", user_id)
+            return True
+        except Exception as e:
+            logger.error("Failed to save model for user %s: %s", user_id, e)
+            return False
+    
+    SOURCES = ('deezer', 'itunes', 'lastfm', 'musicbrainz', 'audiodb')
+    SOURCE_INDEX = {source: i for i, source in enumerate(SOURCES)}
+    GENRE_TERMS = ('rock', 'pop', 'electronic', 'jazz', 'classical', 'hip-hop', 'country', 'folk')
+    
+    # Column layout of a feature row
+    _SOURCE_OFFSET = 12
+    _GENRE_OFFSET = _SOURCE_OFFSET + len(SOURCES)
+    _CONTEXT_OFFSET = _GENRE_OFFSET + len(GENRE_TERMS)
+    _MOOD_OFFSET = _CONTEXT_OFFSET + 5
+    N_FEATURES = _MOOD_OFFSET + 5
+    # Hour-of-day block for every hour: normalized hour, then morning/afternoon/evening/night
+    _HOUR_FEATURES = np.array([
+        (hour / 24.0, 6 <= hour <= 12, 12 <= hour <= 18, 18 <= hour <= 24, 0 <= hour <= 6)
+        for hour in range(24)
+    ], dtype=np.float32)
+    FEATURE_BYTES = N_FEATURES * np.dtype(np.float32).itemsize
+    # Raw track values are normalized column-wise as (value + shift) * scale
+    _TRACK_SHIFT = np.array([0, 0, 0, 0, 0, 0, 60, 0, 0, 0, 0, 0], dtype=np.float32)
+    _TRACK_SCALE = np.array(
+        [1, 1, 1, 1, 1, 1 / 200, 1 / 60, 1 / 100, 1 / 100, 1 / 50, 1, 1], dtype=np.float32
+    )
+    
+    def extract_track_features(self, track: Dict, context: Dict = None) -> np.ndarray:
+        return self.extract_track_features_batch([track], context)[0]
+    
+    def extract_track_features_batch(self, tracks: List[Dict], context: Dict = None) -> np.ndarray:
+        """One float32 feature row per track; the context block is shared by every row"""
+        X = np.zeros((len(tracks), self.N_FEATURES), dtype=np.float32)
+        for i, track in enumerate(tracks):
+            estimated_features = track.get('estimated_features', {})
+            X[i, :self._SOURCE_OFFSET] = (
+                estimated_features.get('energy', 0.5),
+                estimated_features.get('valence', 0.5),
+                estimated_features.get('danceability', 0.5),
+                estimated_features.get('acousticness', 0.3),
+                estimated_features.get('instrumentalness', 0.1),
+                estimated_features.get('tempo', 120),
+                estimated_features.get('loudness', -8),
+                track.get('popularity', 0),
+                track.get('relevance_score', 0),
+                len(track.get('name', '')),
+                1.0 if track.get('preview_url') else 0.0,
+                1.0 if track.get('explicit') else 0.0
+            )
+            source_idx = self.SOURCE_INDEX.get(track.get('source', 'unknown'))
+            if source_idx is not None:
+                X[i, self._SOURCE_OFFSET + source_idx] = 1.0
+            # A genre matches if it is a substring of any tag; tags can't contain newlines.
+            # Last.fm spells hip-hop both ways, so fold the spaced form into GENRE_TERMS' one
+            tags = '\n'.join(track.get('lastfm_tags') or []).lower().replace('hip hop', 'hip-hop')
+            X[i, self._GENRE_OFFSET:self._CONTEXT_OFFSET] = [genre in tags for genre in self.GENRE_TERMS]
         
-        return np.array(features)
+        # Tempo, loudness, popularity, relevance and title length, normalized in one pass
+        track_block = X[:, :self._SOURCE_OFFSET]
+        track_block += self._TRACK_SHIFT
+        track_block *= self._TRACK_SCALE
+        
+        if context:
+            X[:, self._CONTEXT_OFFSET:self._MOOD_OFFSET] = self._HOUR_FEATURES[datetime.now().hour]
+            X[:, self._MOOD_OFFSET:] = self._context_features(context)
+        return X
+    
+    def encode_feedback_features(self, feedback_data: Dict) -> bytes:
+        """Feature row for a feedback record as float32 bytes, stored so training skips JSON parsing"""
+        track = {
+            'name': feedback_data['track_name'],
+            'artist': feedback_data['artist'],
+            'estimated_features': feedback_data.get('track_features') or {},
+            'lastfm_tags': feedback_data.get('track_tags') or [],
+            'source': feedback_data.get('source', 'unknown'),
+            'popularity': feedback_data.get('popularity') or 0,
+            'relevance_score': feedback_data.get('relevance_score') or 0
+        }
+        return self.extract_track_features(track, feedback_data.get('context_data')).tobytes()
+    
+    @staticmethod
+    def _context_features(context: Dict) -> Tuple[float, ...]:
+        mood_data = context.get('mood_analysis', {})
+        musical_context = context.get('musical_context', {})
+        return (
+            mood_data.get('intensity', 0.5),
+            mood_data.get('valence', 0.0),
+            mood_data.get('arousal', 0.5),
+            musical_context.get('energy_preference', 0.5),
+            musical_context.get('familiarity_preference', 0.5)
+        )
     
     def train_user_model(self, user_id: int) -> Dict:
         try:
@@ -114,42 +225,60 @@ class ReinforcementLearningEngine:
                     'current_samples': len(feedback_data)
                 }
             
-            # Prepare training data
-            X_features = []
+            # Prepare training data: rows stored with their feature vector skip the JSON path
+            stored_rows = []
+            legacy_rows = []
+            tracks = []
+            contexts = []
             y_ratings = []
             
             for feedback in feedback_data:
                 try:
-                    # Reconstruct track and context from feedback
-                    track_data = {
-                        'name': feedback['track_name'],
-                        'artist': feedback['artist'],
-                        'estimated_features': json.loads(feedback.get('track_features', '{}')),
-                        'lastfm_tags': json.loads(feedback.get('track_tags', '[]')),
-                        'source': feedback.get('source', 'unknown'),
-                        'popularity': feedback.get('popularity', 0),
-                        'relevance_score': feedback.get('relevance_score', 0)
-                    }
-                    
-                    context_data = json.loads(feedback.get('context_data', '{}'))
-                    
-                    # Extract features
-                    features = self.extract_track_features(track_data, context_data)
-                    
-                    X_features.append(features)
-                    y_ratings.append(feedback['rating'])
+                    rating = feedback['rating']
+                    stored = feedback.get('feedback_features')
+                    if stored is not None and len(stored) == self.FEATURE_BYTES:
+                        stored_rows.append((len(y_ratings), stored))
+                    else:
+                        # Reconstruct track and context from feedback
+                        track_data = {
+                            'name': feedback['track_name'],
+                            'artist': feedback['artist'],
+                            'estimated_features': orjson.loads(feedback.get('track_features', '{}')),
+                            'lastfm_tags': orjson.loads(feedback.get('track_tags', '[]')),
+                            'source': feedback.get('source', 'unknown'),
+                            'popularity': feedback.get('popularity') or 0,
+                            'relevance_score': feedback.get('relevance_score') or 0
+                        }
+                        
+                        context_data = orjson.loads(feedback.get('context_data', '{}'))
+                        
+                        legacy_rows.append(len(y_ratings))
+                        tracks.append(track_data)
+                        contexts.append(context_data)
+                    y_ratings.append(rating)
                     
                 except Exception as e:
-                    logger.warning(f"Failed to process feedback entry: {e}")
+                    logger.warning("Failed to process feedback entry: %s", e)
                     continue
             
-            if len(X_features) < self.config.min_training_samples:
+            if len(y_ratings) < self.config.min_training_samples:
                 return {
                     'success': False,
                     'message': 'Insufficient valid training samples'
                 }
             
-            X = np.array(X_features)
+            X = np.empty((len(y_ratings), self.N_FEATURES), dtype=np.float32)
+            for i, stored in stored_rows:
+                X[i] = np.frombuffer(stored, dtype=np.float32)
+            if tracks:
+                # Track columns in one pass, then each row's own context block
+                legacy_X = self.extract_track_features_batch(tracks)
+                hour_features = self._HOUR_FEATURES[datetime.now().hour]
+                for i, context_data in enumerate(contexts):
+                    if context_data:
+                        legacy_X[i, self._CONTEXT_OFFSET:self._MOOD_OFFSET] = hour_features
+                        legacy_X[i, self._MOOD_OFFSET:] = self._context_features(context_data)
+                X[legacy_rows] = legacy_X
             y = np.array(y_ratings)
             
             # Split data
@@ -160,19 +289,12 @@ class ReinforcementLearningEngine:
             else:
                 X_train, X_test, y_train, y_test = X, X, y, y
             
-            # Scale features
-            scaler = StandardScaler()
+            # Scale features in place; without a split the test set is the training set itself
+            scaler = StandardScaler(copy=False)
             X_train_scaled = scaler.fit_transform(X_train)
-            X_test_scaled = scaler.transform(X_test)
-            
-            # Train model (using Random Forest for better feature importance)
-            model = RandomForestRegressor(
-                n_estimators=100,
-                max_depth=10,
-                random_state=42,
-                n_jobs=-1
-            )
+            X_test_scaled = X_train_scaled if X_test is X_train else scaler.transform(X_test)
             
+            model = self._build_model(len(X_train))
             model.fit(X_train_scaled, y_train)
             
             # Evaluate model
@@ -180,18 +302,30 @@ class ReinforcementLearningEngine:
             mae = mean_absolute_error(y_test, y_pred)
             rmse = np.sqrt(mean_squared_error(y_test, y_pred))
             
-            # Cross-validation score
-            cv_scores = cross_val_score(model, X_train_scaled, y_train, cv=min(3, len(X_train)))
-            cv_score = np.mean(cv_scores)
+            # Cross-validation score; small forests report their out-of-bag R^2 instead of refitting
+            if getattr(model, 'oob_score', False):
+                cv_score = model.oob_score_
+            else:
+                cv_scores = cross_val_score(model, X_train_scaled, y_train, cv=min(3, len(X_train)))
+                cv_score = np.mean(cv_scores)
             
             # Calculate accuracy (1 - normalized MAE)
             accuracy = max(0, 1 - mae / 4.0)  # Rating scale is 1-5
             
+            if isinstance(model, RandomForestRegressor):
+                feature_importance = model.feature_importances_
+            else:
+                # Boosted trees have no impurity importances; measure them once here
+                feature_importance = permutation_importance(
+                    model, X_test_scaled, y_test, n_repeats=5, random_state=42, n_jobs=-1
+                ).importances_mean
+            
             # Store model
             user_model = {
                 'model': model,
                 'scaler': scaler,
-                'feature_importance': model.feature_importances_,
+                'feature_importance': feature_importance,
+                'top_features': self._top_features(feature_importance),
                 'performance': {
                     'mae': mae,
                     'rmse': rmse,
@@ -204,10 +338,13 @@ class ReinforcementLearningEngine:
                 'model_version': '1.0'
             }
             
-            self.user_models[user_id] = user_model
+            # Compiled on first prediction, in the background; sklearn serves until then
+            user_model['compiled_path'] = None
+            with self._user_models_lock:
+                self.user_models[user_id] = user_model
             
-            # Save models
-            self._save_models()
+            # Save model
+            self._save_model(user_id, user_model)
             
             # Update database
             self.db_manager.update_user_model_stats(user_id, {
@@ -216,7 +353,7 @@ class ReinforcementLearningEngine:
                 'last_trained': datetime.now()
             })
             
-            logger.info(f"Trained model for user {user_id}: MAE={mae:.3f}, Accuracy={accuracy:.3f}")
+            logger.info("Trained model for user %s: MAE=%.3f, Accuracy=%.3f", user_id, mae, accuracy)
             
             return {
                 'success': True,
@@ -229,7 +366,7 @@ class ReinforcementLearningEngine:
             }
             
         except Exception as e:
-            logger.error(f"Failed to train model for user {user_id}: {e}")
+            logger.error("Failed to train model for user %s: %s", user_id, e)
             return {
                 'success': False,
                 'message': f'Training failed: {str(e)}'
@@ -237,31 +374,195 @@ class ReinforcementLearningEngine:
     
     def predict_user_rating(self, user_id: int, track: Dict, context: Dict = None) -> float:
         """Predict user rating for a track"""
+        return float(self.predict_batch(user_id, [track], context)[0])
+    
+    def predict_batch(self, user_id: int, tracks: List[Dict], context: Dict = None) -> np.ndarray:
+        """Predict user ratings for many tracks in a single model pass"""
         
-        if user_id not in self.user_models:
+        user_model = self._get_user_model(user_id)
+        if user_model is None:
+            # Too few ratings to train on: skip loading every feedback row just to find that out
+            if self.get_feedback_count(user_id) < self.config.min_training_samples:
+                return np.full(len(tracks), 3.0)
             training_result = self.train_user_model(user_id)
             if not training_result['success']:
-                return 3.0 
+                return np.full(len(tracks), 3.0)
+            user_model = self._get_user_model(user_id)
+        
+        if not tracks:
+            return np.empty(0)
         
         try:
-            user_model = self.user_models[user_id]
-            model = user_model['model']
-            scaler = user_model['scaler']
-            features = self.extract_track_features(track, context)
-            features_scaled = scaler.transform(features.reshape(1, -1))
-            predicted_rating = model.predict(features_scaled)[0]
-            predicted_rating = max(1.0, min(5.0, predicted_rating))
-            return predicted_rating
+            features = self.extract_track_features_batch(tracks, context)
+            features_scaled = user_model['scaler'].transform(features)
+            predictions = self._predict_compiled(user_id, user_model, features_scaled)
+            if predictions is None:
+                model = user_model['model']
+                if isinstance(model, RandomForestRegressor):
+                    predictions = self._predict_rf_lowmem(model, features_scaled)
+                else:
+                    predictions = model.predict(features_scaled)
+            return np.clip(predictions, 1.0, 5.0)
             
         except Exception as e:
-            logger.error(f"Prediction failed for user {user_id}: {e}")
-            return 3.0
+            logger.error("Batch prediction failed for user %s: %s", user_id, e)
+            return np.full(len(tracks), 3.0)
+    
+    @staticmethod
+    def _predict_rf_lowmem(model: RandomForestRegressor, X: np.ndarray) -> np.ndarray:
+        """Forest mean summed into one buffer, trees split across the forest's n_jobs threads"""
+        # Validate once here instead of once per tree; trees expect C-contiguous float32
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        out = np.zeros(X.shape[0])
+        out_lock = threading.Lock()
+        estimators = model.estimators_
+        n_jobs = min(joblib.effective_n_jobs(model.n_jobs), len(estimators))
+        
+        def accumulate(trees):
+            partial = np.zeros(X.shape[0])
+            for tree in trees:
+                partial += tree.predict(X, check_input=False)
+            with out_lock:
+                out[:] += partial
+        
+        joblib.Parallel(n_jobs=n_jobs, require='sharedmem')(
+            joblib.delayed(accumulate)(estimators[i::n_jobs]) for i in range(n_jobs)
+        )
+        out /= len(estimators)
+        return out
+    
+    def _build_model(self, n_samples: int):
+        """Random Forest for small rating histories, histogram boosting once there are enough"""
+        if n_samples >= self.config.hgb_min_samples:
+            return HistGradientBoostingRegressor(
+                max_iter=100,
+                max_depth=6,
+                learning_rate=0.1,
+                early_stopping=True,
+                random_state=42
+            )
+        return RandomForestRegressor(
+            n_estimators=self.config.rf_n_estimators,
+            max_depth=10,
+            min_samples_leaf=3,
+            bootstrap=True,
+            oob_score=n_samples < self.config.cv_skip_threshold,
+            random_state=42,
+            n_jobs=-1
+        )
+    
+    def _compile_model(self, user_id: int, model) -> Optional[str]:
+        """Compile the tree ensemble to a shared library; None leaves prediction on sklearn"""
+        if tl2cgen is None:
+            return None
+        # A fresh name per training, since a library already loaded under a path is never reloaded
+        libpath = os.path.join(self.model_dir, f"user_{user_id}_{time.time_ns()}.so")
+        try:
+            tl2cgen.export_lib(
+                treelite.sklearn.import_model(model),
+                toolchain='gcc',
+                libpath=libpath,
+                params={'parallel_comp': 4}
+            )
+            return libpath
+        except Exception as e:
+            logger.warning("Model compilation failed for user %s, using sklearn: %s", user_id, e)
+            return None
+    
+    def _schedule_compile(self, user_id: int, user_model: Dict):
+        with self._compiles_pending_lock:
+            if user_id in self._compiles_pending:
+                return
+            self._compiles_pending.add(user_id)
+        self._compile_executor.submit(self._compile_and_attach, user_id, user_model)
+    
+    def _compile_and_attach(self, user_id: int, user_model: Dict):
+        """Runs on the compile worker: build the library and attach it if the model is still current"""
+        try:
+            libpath = self._compile_model(user_id, user_model['model'])
+            if libpath is None:
+                return
+            with self._model_files_lock:
+                with self._user_models_lock:
+                    current = self.user_models.get(user_id) is user_model
+                    if current:
+                        user_model['compiled_path'] = libpath
+                if current:
+                    self._save_model(user_id, user_model)
+            if current:
+                self._discard_compiled(user_id, keep=libpath)
+            else:
+                # Retrained (or evicted) while compiling; the next prediction compiles the new model
+                os.remove(libpath)
+        except Exception as e:
+            logger.warning("Background compilation failed for user %s: %s", user_id, e)
+        finally:
+            with self._compiles_pending_lock:
+                self._compiles_pending.discard(user_id)
+    
+    def _predict_compiled(self, user_id: int, user_model: Dict, features_scaled: np.ndarray) -> Optional[np.ndarray]:
+        if tl2cgen is None:
+            return None
+        libpath = user_model.get('compiled_path')
+        if not libpath:
+            self._schedule_compile(user_id, user_model)
+            return None
+        try:
+            with self._compiled_predictors_lock:
+                predictor = self._compiled_predictors.get(libpath)
+            if predictor is None:
+                predictor = tl2cgen.Predictor(libpath)
+                with self._compiled_predictors_lock:
+                    self._compiled_predictors[libpath] = predictor
+            predictions = predictor.predict(tl2cgen.DMatrix(features_scaled))
+            return np.asarray(predictions).reshape(features_scaled.shape[0])
+        except Exception as e:
+            logger.warning("Compiled prediction failed, using sklearn: %s", e)
+            return None
+    
+    def _discard_compiled(self, user_id: int, keep: Optional[str] = None):
+        """Delete the user's libraries from earlier trainings"""
+        prefix = f"user_{user_id}_"
+        for filename in os.listdir(self.model_dir):
+            libpath = os.path.join(self.model_dir, filename)
+            if not (filename.startswith(prefix) and filename.endswith(".so")) or libpath == keep:
+                continue
+            with self._compiled_predictors_lock:
+                self._compiled_predictors.pop(libpath, None)
+            try:
+                os.remove(libpath)
+            except OSError:
+                pass
+    
+    def get_feedback_count(self, user_id: int) -> int:
+        with self._feedback_counts_lock:
+            count = self._feedback_counts.get(user_id)
+        if count is None:
+            count = self.db_manager.get_user_feedback_count(user_id)
+            with self._feedback_counts_lock:
+                self._feedback_counts[user_id] = count
+        return count
+    
+    def invalidate_feedback_count(self, user_id: int):
+        with self._feedback_counts_lock:
+            self._feedback_counts.pop(user_id, None)
+    
+    def predict_with_confidence(self, user_id: int, tracks: List[Dict], context: Dict = None) -> Tuple[np.ndarray, float]:
+        """Batch ratings plus the model confidence, from one lookup of the user model"""
+        predictions = self.predict_batch(user_id, tracks, context)
+        user_model = self._get_user_model(user_id)
+        if user_model is None:
+            return predictions, 0.0
+        return predictions, self._model_confidence(user_model)
     
     def get_prediction_confidence(self, user_id: int, track: Dict) -> float:
-        if user_id not in self.user_models:
+        user_model = self._get_user_model(user_id)
+        if user_model is None:
             return 0.0
+        return self._model_confidence(user_model)
+    
+    def _model_confidence(self, user_model: Dict) -> float:
         try:
-            user_model = self.user_models[user_id]
             performance = user_model['performance']
             base_confidence = performance['accuracy']
             training_samples = performance['training_samples']
@@ -270,11 +571,12 @@ class ReinforcementLearningEngine:
             return max(0.0, min(1.0, confidence))
             
         except Exception as e:
-            logger.error(f"Confidence calculation failed: {e}")
+            logger.error("Confidence calculation failed: %s", e)
             return 0.0
     
     def get_user_insights(self, user_id: int) -> Dict:
-        if user_id not in self.user_models:
+        user_model = self._get_user_model(user_id)
+        if user_model is None:
             feedback_count = self.db_manager.get_user_feedback_count(user_id)
             return {
                 'model_exists': False,
@@ -283,13 +585,10 @@ class ReinforcementLearningEngine:
                 'message': f'Need {self.config.min_training_samples - feedback_count} more ratings to create model'
             }
         
-        user_model = self.user_models[user_id]
         performance = user_model['performance']
-        feature_names = self._get_feature_names()
-        feature_importance = user_model['feature_importance']
-        top_features_idx = np.argsort(feature_importance)[-5:]
-        top_features = [(feature_names[i], feature_importance[i]) for i in top_features_idx]
-        preference_patterns = self.db_manager.get_user_preference_patterns(user_id)
+        # Models saved before top_features was stored compute it here
+        top_features = user_model.get('top_features') or self._top_features(user_model['feature_importance'])
+        preference_patterns = self._get_preference_patterns(user_id)
         insights = {
             'model_exists': True,
             'model_accuracy': performance['accuracy'],
@@ -303,6 +602,18 @@ class ReinforcementLearningEngine:
         
         return insights
     
+    def _get_preference_patterns(self, user_id: int) -> Dict:
+        feedback_count = self.get_feedback_count(user_id)
+        with self._preference_patterns_lock:
+            cached = self._preference_patterns.get(user_id)
+        if cached is not None and cached[0] == feedback_count:
+            return cached[1]
+        
+        preference_patterns = self.db_manager.get_user_preference_patterns(user_id)
+        with self._preference_patterns_lock:
+            self._preference_patterns[user_id] = (feedback_count, preference_patterns)
+        return preference_patterns
+    
     def get_detailed_insights(self, user_id: int) -> Dict:
         basic_insights = self.get_user_insights(user_id)
         
@@ -327,14 +638,14 @@ class ReinforcementLearningEngine:
         return detailed_insights
     
     def get_performance_history(self, user_id: int) -> Dict:
-        if user_id not in self.user_models:
+        user_model = self._get_user_model(user_id)
+        if user_model is None:
             return {'accuracy_history': [], 'feature_importance': {}}
         performance_history = self.db_manager.get_user_model_performance_history(user_id)
-        user_model = self.user_models[user_id]
-        feature_names = self._get_feature_names()
-        feature_importance = dict(zip(feature_names, user_model['feature_importance']))
-        sorted_features = dict(sorted(feature_importance.items(), 
-                                    key=lambda x: x[1], reverse=True)[:10])
+        feature_importance = user_model['feature_importance']
+        sorted_features = {
+            _FEATURE_NAMES[i]: feature_importance[i] for i in self._top_feature_idx(feature_importance, 10)
+        }
         
         return {
             'accuracy_history': performance_history,
@@ -342,20 +653,19 @@ class ReinforcementLearningEngine:
         }
     
     async def update_user_model(self, user_id: int) -> Dict:
-        return self.train_user_model(user_id)
-    
-    def _get_feature_names(self) -> List[str]:
-        return [
-            'energy', 'valence', 'danceability', 'acousticness', 'instrumentalness', 
-            'tempo', 'loudness', 'popularity', 'relevance_score', 'title_length',
-            'has_preview', 'explicit',
-            'source_deezer', 'source_itunes', 'source_lastfm', 'source_musicbrainz', 'source_audiodb',
-            'genre_rock', 'genre_pop', 'genre_electronic', 'genre_jazz', 'genre_classical', 
-            'genre_hip_hop', 'genre_country', 'genre_folk',
-            'hour_normalized', 'is_morning', 'is_afternoon', 'is_evening', 'is_night',
-            'mood_intensity', 'mood_valence', 'mood_arousal',
-            'energy_preference', 'familiarity_preference'
-        ]
+        return await asyncio.to_thread(self.train_user_model, user_id)
+    
+    @staticmethod
+    def _top_feature_idx(feature_importance: np.ndarray, k: int) -> np.ndarray:
+        """Indices of the k most important features, most important first (ties by column)"""
+        k = min(k, len(feature_importance))
+        top_idx = np.argpartition(feature_importance, -k)[-k:]
+        return top_idx[np.lexsort((top_idx, -feature_importance[top_idx]))]
+    
+    @classmethod
+    def _top_features(cls, feature_importance: np.ndarray, k: int = 5) -> List[Tuple[str, float]]:
+        """The k most important features, least important first"""
+        return [(_FEATURE_NAMES[i], feature_importance[i]) for i in cls._top_feature_idx(feature_importance, k)[::-1]]
     
     def _get_model_quality_description(self, accuracy: float) -> str:
         if accuracy >= 0.85:
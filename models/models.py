@@ -1,8 +1,9 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import List, Dict, Optional
 
 class MoodAnalysis(BaseModel):
     """Structured mood analysis output"""
+    model_config = ConfigDict(frozen=True)
     primary_emotion : str = Field(description="Primary emotion state")
     intensity : float = Field(description="Emotional intensity from 0 - 1") 
     valence : float = Field(description="Emotional valence from -1 to 1")
@@ -14,6 +15,7 @@ class MoodAnalysis(BaseModel):
 
 class MusicalContext(BaseModel):
     """Structured musical context output"""
+    model_config = ConfigDict(frozen=True)
     activity_type: str = Field(description="Type of activity or situation")
     energy_preference: float = Field(description="Preferred energy level 0-1")
     familiarity_preference: float = Field(description="Want familiar vs new music 0-1")
@@ -25,6 +27,7 @@ class MusicalContext(BaseModel):
 
 class TrackRecommendation(BaseModel):
     """Structured track recommendation"""
+    model_config = ConfigDict(frozen=True)
     track_id : str
     name : str
     artist : str
@@ -39,6 +42,7 @@ class TrackRecommendation(BaseModel):
 
 class RecommendationResponse(BaseModel):
     """Complete recommendation response"""
+    model_config = ConfigDict(frozen=True)
     recommendations : List[TrackRecommendation]
     explanation : str = Field(description="Natural language explanation")
     mood_analysis : MoodAnalysis
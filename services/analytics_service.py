@@ -1,78 +1,82 @@
-import pandas as pd
 import sqlite3
+from datetime import date
 from typing import Dict, List
-import json
 
 class AnalyticsService:
     def __init__(self, db_manager):
         self.db_manager = db_manager
     
     def get_temporal_patterns(self, user_id: int) -> Dict:
-        try:
-            with sqlite3.connect(self.db_manager.db_path) as conn:
-                interactions_df = pd.read_sql_query('''
-                    SELECT timestamp FROM interactions WHERE user_id = ?
-                ''', 'sqlite:///'+self.db_path, params=(user_id,))
-                
-                if len(interactions_df) == 0:
-                    return {}
-                
-                interactions_df['timestamp'] = pd.to_datetime(interactions_df['timestamp'])
-                interactions_df['hour'] = interactions_df['timestamp'].dt.hour
-                interactions_df['day_of_week'] = interactions_df['timestamp'].dt.day_name()
-                hourly_patterns = interactions_df['hour'].value_counts().to_dict()
-                daily_patterns = interactions_df['day_of_week'].value_counts().to_dict()
-                peak_hour = interactions_df['hour'].mode()[0] if len(interactions_df) > 0 else 12
-                peak_day = interactions_df['day_of_week'].mode()[0] if len(interactions_df) > 0 else 'Monday'
-                
-                return {
-                    'hourly_patterns': hourly_patterns,
-                    'daily_patterns': daily_patterns,
-                    'peak_hour': peak_hour,
-                    'peak_day': peak_day,
-                    'total_sessions': len(interactions_df)
-                }
-                
-        except Exception as e:
-            print(f"Error getting temporal patterns: {e}")
+        # Hour/day counts are grouped in SQL by the database manager
+        patterns = self.db_manager.get_user_temporal_patterns(user_id)
+        if not patterns:
             return {}
+        
+        return {
+            'hourly_patterns': patterns['hourly_activity'],
+            'daily_patterns': patterns['daily_activity'],
+            'peak_hour': patterns['peak_hour'],
+            'peak_day': patterns['peak_day'],
+            'total_sessions': sum(patterns['hourly_activity'].values())
+        }
     
     def get_music_discovery_trends(self, user_id: int) -> Dict:
         try:
-            with sqlite3.connect(self.db_manager.db_path) as conn:
-                feedback_df = pd.read_sql_query('''
-                    SELECT rating, timestamp, track_tags, artist 
+            with self.db_manager.acquire() as conn:
+                total_ratings, total_artists, average_rating = conn.execute('''
+                    SELECT COUNT(*), COUNT(DISTINCT artist), AVG(rating)
                     FROM feedback WHERE user_id = ?
-                    ORDER BY timestamp
-                ''', 'sqlite:///'+self.db_path, params=(user_id,))
+                ''', (user_id,)).fetchone()
                 
-                if len(feedback_df) == 0:
+                if total_ratings == 0:
                     return {}
                 
-                feedback_df['timestamp'] = pd.to_datetime(feedback_df['timestamp'])
-                total_artists = feedback_df['artist'].nunique()
-                total_ratings = len(feedback_df)
-                all_genres = []
-                for tags_json in feedback_df['track_tags'].dropna():
-                    try:
-                        tags = json.loads(tags_json)
-                        all_genres.extend(tags[:3])
-                    except:
-                        continue
+                # First three tags of each rated track
+                unique_genres = conn.execute('''
+                    SELECT COUNT(DISTINCT ft.tag) FROM feedback_tag ft
+                    JOIN feedback f ON f.id = ft.feedback_id
+                    WHERE f.user_id = ? AND ft.position < 3
+                ''', (user_id,)).fetchone()[0]
                 
-                unique_genres = len(set(all_genres))
-                feedback_df['week'] = feedback_df['timestamp'].dt.isocalendar().week
-                weekly_avg_rating = feedback_df.groupby('week')['rating'].mean()
-                feedback_df['cumulative_artists'] = feedback_df.groupby('artist').cumcount() == 0
-                discovery_rate = feedback_df['cumulative_artists'].cumsum()
+                # Running count of distinct artists after each of the last ten ratings
+                discovery_rate = [row[0] for row in conn.execute('''
+                    SELECT discovered FROM (
+                        SELECT timestamp, id,
+                               SUM(is_new) OVER (ORDER BY timestamp, id ROWS UNBOUNDED PRECEDING) AS discovered
+                        FROM (
+                            SELECT id, timestamp,
+                                   ROW_NUMBER() OVER (PARTITION BY artist ORDER BY timestamp, id) = 1 AS is_new
+                            FROM feedback WHERE user_id = ?
+                        )
+                    )
+                    ORDER BY timestamp DESC, id DESC
+                    LIMIT 10
+                ''', (user_id,))]
+                discovery_rate.reverse()
                 
-                return {
-                    'total_artists_discovered': total_artists,
-                    'unique_genres_explored': unique_genres,
-                    'average_exploration_rating': feedback_df['rating'].mean(),
-                    'discovery_rate_trend': discovery_rate.tolist()[-10:],  # Last 10 data points
-                    'weekly_satisfaction': weekly_avg_rating.to_dict()
-                }
+                # Per-day sums folded into ISO weeks here, since SQLite has no ISO week format
+                daily_ratings = conn.execute('''
+                    SELECT date(timestamp), SUM(rating), COUNT(*)
+                    FROM feedback WHERE user_id = ? AND date(timestamp) IS NOT NULL
+                    GROUP BY date(timestamp)
+                ''', (user_id,)).fetchall()
+            
+            weekly_sums = {}
+            for day, rating_sum, count in daily_ratings:
+                week = date.fromisoformat(day).isocalendar()[1]
+                week_sum, week_count = weekly_sums.get(week, (0, 0))
+                weekly_sums[week] = (week_sum + rating_sum, week_count + count)
+            weekly_avg_rating = {
+                week: rating_sum / count for week, (rating_sum, count) in sorted(weekly_sums.items())
+            }
+            
+            return {
+                'total_artists_discovered': total_artists,
+                'unique_genres_explored': unique_genres,
+                'average_exploration_rating': average_rating,
+                'discovery_rate_trend': discovery_rate,  # Last 10 data points
+                'weekly_satisfaction': weekly_avg_rating
+            }
                 
         except Exception as e:
             print(f"Error getting discovery trends: {e}")
@@ -1,34 +1,78 @@
+import copy
 import hashlib
+import hmac
 import sqlite3
+import threading
 from typing import Dict, Optional
 from datetime import datetime
-import json
+import orjson
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHash, VerificationError
+from cachetools import TTLCache
 
 class UserService:
     
+    USER_CACHE_SIZE = 1024
+    USER_CACHE_TTL = 60  # seconds a looked-up user is served without a query
+    
+    # Fixed query texts, so each pooled connection's statement cache prepares them once
+    _USER_COLUMNS = 'id, username, email, full_name, created_at, last_login, preferences, settings'
+    _INSERT_USER = '''
+        INSERT INTO users (username, email, full_name, password_hash, preferences, settings)
+        VALUES (?, ?, ?, ?, ?, ?)
+    '''
+    _SELECT_LOGIN = 'SELECT id, password_hash FROM users WHERE username = ?'
+    _SELECT_PASSWORD_HASH = 'SELECT password_hash FROM users WHERE id = ?'
+    _SELECT_USER_BY_USERNAME = f'SELECT {_USER_COLUMNS} FROM users WHERE username = ?'
+    _SELECT_USER_BY_ID = f'SELECT {_USER_COLUMNS} FROM users WHERE id = ?'
+    _UPDATE_LAST_LOGIN = 'UPDATE users SET last_login = ? WHERE id = ?'
+    _UPDATE_LAST_LOGIN_AND_HASH = 'UPDATE users SET last_login = ?, password_hash = ? WHERE id = ?'
+    _UPDATE_PASSWORD_HASH = 'UPDATE users SET password_hash = ? WHERE id = ?'
+    _UPDATE_PREFERENCES = 'UPDATE users SET preferences = ? WHERE id = ?'
+    _UPDATE_SETTINGS = 'UPDATE users SET settings = ? WHERE id = ?'
+    _SELECT_STATS = '''
+        SELECT
+            (SELECT COUNT(*) FROM interactions WHERE user_id = :user_id),
+            COALESCE((SELECT total_feedback FROM user_feedback_agg WHERE user_id = :user_id), 0),
+            (SELECT rating_sum / total_feedback FROM user_feedback_agg WHERE user_id = :user_id)
+    '''
+    _SELECT_RECENT_HIGH_RATED = '''
+        SELECT track_name, artist, rating, timestamp
+        FROM feedback 
+        WHERE user_id = ? AND rating IN (4, 5)
+        ORDER BY timestamp DESC
+        LIMIT 5
+    '''
+    # The users_del trigger removes the user's feedback, interactions and model history with it
+    _DELETE_USER = 'DELETE FROM users WHERE id = ?'
+    
+    # Every new account starts from the same JSON, so it is encoded once
+    _DEFAULT_PREFERENCES = orjson.dumps({}).decode()
+    _DEFAULT_SETTINGS = orjson.dumps({
+        'theme': 'dark',
+        'email_notifications': True,
+        'ai_learning_enabled': True
+    }).decode()
+    
     def __init__(self, db_manager):
         self.db_manager = db_manager
+        # Argon2id with a per-user salt embedded in each stored hash
+        self._password_hasher = PasswordHasher(time_cost=3, memory_cost=4096, parallelism=1)
+        # ('id', user_id) / ('username', username) -> user dict; dropped on every write to that user
+        self._user_cache = TTLCache(maxsize=self.USER_CACHE_SIZE, ttl=self.USER_CACHE_TTL)
+        self._user_cache_lock = threading.Lock()
     
     def create_user(self, username: str, email: str, password: str, full_name: str = None) -> bool:
         try:
             password_hash = self._hash_password(password)
-            with sqlite3.connect(self.db_manager.db_path) as conn:
-                cursor = conn.cursor()
-                
-                cursor.execute('''
-                    INSERT INTO users (username, email, full_name, password_hash, preferences, settings)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (
+            with self.db_manager.acquire() as conn:
+                conn.execute(self._INSERT_USER, (
                     username,
                     email,
                     full_name,
                     password_hash,
-                    json.dumps({}), 
-                    json.dumps({   
-                        'theme': 'dark',
-                        'email_notifications': True,
-                        'ai_learning_enabled': True
-                    })
+                    self._DEFAULT_PREFERENCES,
+                    self._DEFAULT_SETTINGS
                 ))
                 
                 conn.commit()
@@ -42,24 +86,20 @@ class UserService:
     
     def authenticate(self, username: str, password: str) -> bool:
         try:
-            password_hash = self._hash_password(password)
-            
-            with sqlite3.connect(self.db_manager.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT id FROM users 
-                    WHERE username = ? AND password_hash = ?
-                ''', (username, password_hash))
-                
-                result = cursor.fetchone()
-                
-                if result:
-                    # Update last login
-                    cursor.execute('''
-                        UPDATE users SET last_login = ? WHERE id = ?
-                    ''', (datetime.now(), result[0]))
+            with self.db_manager.acquire() as conn:
+                result = conn.execute(self._SELECT_LOGIN, (username,)).fetchone()
+                
+                if result and self._verify_password(result[1], password):
+                    # Update last login, upgrading legacy or outdated hashes while we have the password
+                    if self._needs_rehash(result[1]):
+                        conn.execute(
+                            self._UPDATE_LAST_LOGIN_AND_HASH,
+                            (datetime.now(), self._hash_password(password), result[0])
+                        )
+                    else:
+                        conn.execute(self._UPDATE_LAST_LOGIN, (datetime.now(), result[0]))
                     conn.commit()
-                    
+                    self._invalidate_user(result[0])
                     return True
                 
                 return False
@@ -68,63 +108,61 @@ class UserService:
             print(f"Authentication error: {e}")
             return False
     
+    def _cached_user(self, key) -> Optional[Dict]:
+        with self._user_cache_lock:
+            user = self._user_cache.get(key)
+        # Callers get their own copy, so edits to it never leak into the cache
+        return copy.deepcopy(user) if user is not None else None
+    
+    def _cache_user(self, row) -> Optional[Dict]:
+        if not row:
+            return None
+        user = {
+            'id': row[0],
+            'username': row[1],
+            'email': row[2],
+            'full_name': row[3],
+            'created_at': row[4],
+            'last_login': row[5],
+            'preferences': orjson.loads(row[6]) if row[6] else {},
+            'settings': orjson.loads(row[7]) if row[7] else {}
+        }
+        with self._user_cache_lock:
+            self._user_cache[('id', user['id'])] = user
+            self._user_cache[('username', user['username'])] = user
+        return copy.deepcopy(user)
+    
+    def _invalidate_user(self, user_id: int):
+        with self._user_cache_lock:
+            stale = [key for key, user in self._user_cache.items() if user['id'] == user_id]
+            for key in stale:
+                self._user_cache.pop(key, None)
+    
     def get_user_by_username(self, username: str) -> Optional[Dict]:
         """Get user data by username"""
         
+        cached = self._cached_user(('username', username))
+        if cached is not None:
+            return cached
+        
         try:
-            with sqlite3.connect(self.db_manager.db_path) as conn:
-                cursor = conn.cursor()
-                
-                cursor.execute('''
-                    SELECT id, username, email, full_name, created_at, last_login, preferences, settings
-                    FROM users WHERE username = ?
-                ''', (username,))
-                
-                row = cursor.fetchone()
-                
-                if row:
-                    return {
-                        'id': row[0],
-                        'username': row[1],
-                        'email': row[2],
-                        'full_name': row[3],
-                        'created_at': row[4],
-                        'last_login': row[5],
-                        'preferences': json.loads(row[6]) if row[6] else {},
-                        'settings': json.loads(row[7]) if row[7] else {}
-                    }
-                
-                return None
+            with self.db_manager.acquire() as conn:
+                row = conn.execute(self._SELECT_USER_BY_USERNAME, (username,)).fetchone()
+                return self._cache_user(row)
                 
         except Exception as e:
             print(f"Error getting user: {e}")
             return None
     
     def get_user_by_id(self, user_id: int) -> Optional[Dict]:
+        cached = self._cached_user(('id', user_id))
+        if cached is not None:
+            return cached
+        
         try:
-            with sqlite3.connect(self.db_manager.db_path) as conn:
-                cursor = conn.cursor()
-                
-                cursor.execute('''
-                    SELECT id, username, email, full_name, created_at, last_login, preferences, settings
-                    FROM users WHERE id = ?
-                ''', (user_id,))
-                
-                row = cursor.fetchone()
-                
-                if row:
-                    return {
-                        'id': row[0],
-                        'username': row[1],
-                        'email': row[2],
-                        'full_name': row[3],
-                        'created_at': row[4],
-                        'last_login': row[5],
-                        'preferences': json.loads(row[6]) if row[6] else {},
-                        'settings': json.loads(row[7]) if row[7] else {}
-                    }
-                
-                return None
+            with self.db_manager.acquire() as conn:
+                row = conn.execute(self._SELECT_USER_BY_ID, (user_id,)).fetchone()
+                return self._cache_user(row)
                 
         except Exception as e:
             print(f"Error getting user: {e}")
@@ -132,14 +170,11 @@ class UserService:
     
     def update_user_preferences(self, user_id: int, preferences: Dict) -> bool:
         try:
-            with sqlite3.connect(self.db_manager.db_path) as conn:
-                cursor = conn.cursor()
-                
-                cursor.execute('''
-                    UPDATE users SET preferences = ? WHERE id = ?
-                ''', (json.dumps(preferences), user_id))
+            with self.db_manager.acquire() as conn:
+                cursor = conn.execute(self._UPDATE_PREFERENCES, (orjson.dumps(preferences).decode(), user_id))
                 
                 conn.commit()
+                self._invalidate_user(user_id)
                 return cursor.rowcount > 0
                 
         except Exception as e:
@@ -148,14 +183,11 @@ class UserService:
     
     def update_user_settings(self, user_id: int, settings: Dict) -> bool:
         try:
-            with sqlite3.connect(self.db_manager.db_path) as conn:
-                cursor = conn.cursor()
-                
-                cursor.execute('''
-                    UPDATE users SET settings = ? WHERE id = ?
-                ''', (json.dumps(settings), user_id))
+            with self.db_manager.acquire() as conn:
+                cursor = conn.execute(self._UPDATE_SETTINGS, (orjson.dumps(settings).decode(), user_id))
                 
                 conn.commit()
+                self._invalidate_user(user_id)
                 return cursor.rowcount > 0
                 
         except Exception as e:
@@ -164,25 +196,12 @@ class UserService:
     
     def get_user_stats(self, user_id: int) -> Dict:
         try:
-            with sqlite3.connect(self.db_manager.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT COUNT(*) FROM interactions WHERE user_id = ?', (user_id,))
-                total_interactions = cursor.fetchone()[0]
-                
-                cursor.execute('SELECT COUNT(*) FROM feedback WHERE user_id = ?', (user_id,))
-                total_feedback = cursor.fetchone()[0]
-                
-                cursor.execute('SELECT AVG(rating) FROM feedback WHERE user_id = ?', (user_id,))
-                avg_rating_result = cursor.fetchone()
-                average_rating = avg_rating_result[0] if avg_rating_result[0] else 0
+            with self.db_manager.acquire() as conn:
+                total_interactions, total_feedback, average_rating = conn.execute(
+                    self._SELECT_STATS, {'user_id': user_id}
+                ).fetchone()
+                average_rating = average_rating or 0
                 personalization_level = min(1.0, total_feedback / 20.0)
-                cursor.execute('''
-                    SELECT track_name, artist, rating, timestamp
-                    FROM feedback 
-                    WHERE user_id = ? AND rating >= 4
-                    ORDER BY timestamp DESC
-                    LIMIT 5
-                ''', (user_id,))
                 
                 recent_high_rated = [
                     {
@@ -191,7 +210,7 @@ class UserService:
                         'rating': row[2],
                         'timestamp': row[3]
                     }
-                    for row in cursor.fetchall()
+                    for row in conn.execute(self._SELECT_RECENT_HIGH_RATED, (user_id,))
                 ]
                 
                 return {
@@ -214,14 +233,11 @@ class UserService:
     
     def delete_user(self, user_id: int) -> bool:
         try:
-            with sqlite3.connect(self.db_manager.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('DELETE FROM feedback WHERE user_id = ?', (user_id,))
-                cursor.execute('DELETE FROM interactions WHERE user_id = ?', (user_id,))
-                cursor.execute('DELETE FROM user_model_performance WHERE user_id = ?', (user_id,))
-                cursor.execute('DELETE FROM users WHERE id = ?', (user_id,))
+            with self.db_manager.acquire() as conn:
+                cursor = conn.execute(self._DELETE_USER, (user_id,))
                 
                 conn.commit()
+                self._invalidate_user(user_id)
                 return cursor.rowcount > 0
                 
         except Exception as e:
@@ -229,32 +245,38 @@ class UserService:
             return False
     
     def _hash_password(self, password: str) -> str:
+        return self._password_hasher.hash(password)
+    
+    def _verify_password(self, stored_hash: str, password: str) -> bool:
+        if not stored_hash.startswith('$argon2'):
+            # Accounts created before Argon2 hold a salted SHA-256 until their next login
+            return hmac.compare_digest(stored_hash, self._legacy_hash_password(password))
+        try:
+            return self._password_hasher.verify(stored_hash, password)
+        except (VerificationError, InvalidHash):
+            return False
+    
+    def _needs_rehash(self, stored_hash: str) -> bool:
+        return not stored_hash.startswith('$argon2') or self._password_hasher.check_needs_rehash(stored_hash)
+    
+    @staticmethod
+    def _legacy_hash_password(password: str) -> str:
         salt = "music_curator_salt"
         return hashlib.sha256((password + salt).encode()).hexdigest()
     
     def change_password(self, user_id: int, old_password: str, new_password: str) -> bool:
         try:
-            user = self.get_user_by_id(user_id)
-            if not user:
-                return False
-            
-            old_hash = self._hash_password(old_password)
-            
-            with sqlite3.connect(self.db_manager.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT id FROM users WHERE id = ? AND password_hash = ?
-                ''', (user_id, old_hash))
-                
-                if not cursor.fetchone():
+            # The password check also covers the user existing; no separate lookup checkout
+            with self.db_manager.acquire() as conn:
+                row = conn.execute(self._SELECT_PASSWORD_HASH, (user_id,)).fetchone()
+                if not row or not self._verify_password(row[0], old_password):
                     return False 
                 
                 new_hash = self._hash_password(new_password)
-                cursor.execute('''
-                    UPDATE users SET password_hash = ? WHERE id = ?
-                ''', (new_hash, user_id))
+                cursor = conn.execute(self._UPDATE_PASSWORD_HASH, (new_hash, user_id))
                 
                 conn.commit()
+                self._invalidate_user(user_id)
                 return cursor.rowcount > 0
                 
         except Exception as e:
@@ -3,13 +3,24 @@ from langchain.tools import BaseTool
 from langchain.callbacks.manager import CallbackManagerForToolRun, AsyncCallbackManagerForToolRun
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-import json
-import asyncio
+import orjson
 from dotenv import load_dotenv
 from configs.configurations import config
 
 load_dotenv()
 
+def _dumps(obj, indent: bool = False) -> str:
+    """orjson-encode to the str the prompt and the tool result expect"""
+    option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+    return orjson.dumps(obj, option=option).decode()
+
+# Audio features shown to the LLM per candidate, with the value assumed when a track lacks one
+_AUDIO_FEATURE_DEFAULTS = (
+    ('energy', 0.5), ('valence', 0.5), ('danceability', 0.5), ('acousticness', 0.3), ('tempo', 120)
+)
+# Only the first candidates are summarized into the prompt
+_MAX_PROMPT_TRACKS = 15
+
 
 class IntelligentRankingTool(BaseTool):
     name: str = "intelligent_ranking"
@@ -20,17 +31,38 @@ class IntelligentRankingTool(BaseTool):
         ranking_input: str, 
         run_manager: Optional[CallbackManagerForToolRun] = None
     ) -> str:    
+        data = {}
         try:
-            data = json.loads(ranking_input)
-            tracks = data['tracks']
-            context = data['context']
-            mood = data['mood']
+            data = orjson.loads(ranking_input)
+            prompt_inputs = self._prompt_inputs(data)
+            result = self._build_chain().invoke(prompt_inputs)
+            return self._rank_tracks(result, data['tracks'])
             
-            llm = config.llm
-            prompt = ChatPromptTemplate.from_messages([
-                ("system", """You are a world-class music curator with deep understanding of human psychology, musical aesthetics, and cultural context.
+        except Exception as e:
+            return self._error_result(e, data)
+    
+    async def _arun(
+        self, 
+        ranking_input: str, 
+        run_manager: Optional[AsyncCallbackManagerForToolRun] = None
+    ) -> str:
+        """Async version of _run; the LLM call goes through the chain's async client"""
+        data = {}
+        try:
+            data = orjson.loads(ranking_input)
+            prompt_inputs = self._prompt_inputs(data)
+            result = await self._build_chain().ainvoke(prompt_inputs)
+            return self._rank_tracks(result, data['tracks'])
+            
+        except Exception as e:
+            return self._error_result(e, data)
+    
+    def _build_chain(self):
+        llm = config.llm
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", """You are a world-class music curator with deep understanding of human psychology, musical aesthetics, and cultural context.
                     Your task is to rank tracks based on sophisticated musical and psychological criteria."""),
-                                    ("human", """
+                                ("human", """
                     User Context:
                     Mood Analysis: {mood_analysis}
                     Musical Context: {musical_context}
@@ -53,88 +85,83 @@ class IntelligentRankingTool(BaseTool):
                         "top_pick_explanation": "why the top choice is perfect for this context"
                     }}
                 """)
-            ])
-            
-            tracks_summary = []
-            for i, track in enumerate(tracks[:15]): 
-                estimated_features = track.get('estimated_features', {})
-                summary = {
-                    'index': i,
-                    'name': track['name'],
-                    'artist': track['artist'],
-                    'source': track.get('source', 'unknown'),
-                    'popularity': track.get('popularity', 0),
-                    'genre': track.get('genre', 'unknown'),
-                    'audio_features': {
-                        'energy': estimated_features.get('energy', 0.5),
-                        'valence': estimated_features.get('valence', 0.5),
-                        'danceability': estimated_features.get('danceability', 0.5),
-                        'acousticness': estimated_features.get('acousticness', 0.3),
-                        'tempo': estimated_features.get('tempo', 120)
-                    },
-                    'tags': track.get('lastfm_tags', [])[:5],
-                    'has_preview': bool(track.get('preview_url')),
-                    'relevance_score': track.get('relevance_score', 0)
-                }
-                tracks_summary.append(summary)
+        ])
+        return prompt | llm | StrOutputParser()
+    
+    def _prompt_inputs(self, data: dict) -> dict:
+        tracks = data['tracks']
+        context = data['context']
+        mood = data['mood']
+        
+        tracks_summary = [
+            {
+                'index': i,
+                'name': track['name'],
+                'artist': track['artist'],
+                'source': track.get('source', 'unknown'),
+                'popularity': track.get('popularity', 0),
+                'genre': track.get('genre', 'unknown'),
+                'audio_features': self._audio_features(track.get('estimated_features') or {}),
+                'tags': (track.get('lastfm_tags') or [])[:5],
+                'has_preview': bool(track.get('preview_url')),
+                'relevance_score': track.get('relevance_score', 0)
+            }
+            for i, track in enumerate(tracks[:_MAX_PROMPT_TRACKS])
+        ]
+        
+        return {
+            'mood_analysis': _dumps(mood, indent=True),
+            'musical_context': _dumps(context, indent=True),
+            'tracks_summary': _dumps(tracks_summary, indent=True)
+        }
+    
+    def _rank_tracks(self, result: str, tracks: list) -> str:
+        try:
+            ranking_result = orjson.loads(result)
+            ranked_indices = ranking_result.get('ranked_indices', list(range(len(tracks))))
+            ranked_tracks = []
+            n_ranked = len(ranked_indices)
+            n_tracks = len(tracks)
             
-            chain = prompt | llm | StrOutputParser()
+            for rank, idx in enumerate(ranked_indices):
+                if idx < n_tracks:
+                    track = tracks[idx].copy()
+                    track['ranking_score'] = n_ranked - rank
+                    ranked_tracks.append(track)
             
-            result = chain.invoke({
-                'mood_analysis': json.dumps(mood, indent=2),
-                'musical_context': json.dumps(context, indent=2),
-                'tracks_summary': json.dumps(tracks_summary, indent=2)
+            return _dumps({
+                'ranked_tracks': ranked_tracks,
+                'reasoning': ranking_result.get('reasoning', ''),
+                'top_pick_explanation': ranking_result.get('top_pick_explanation', ''),
+                'ranking_method': 'llm_intelligent'
             })
             
-            try:
-                ranking_result = json.loads(result)
-                ranked_indices = ranking_result.get('ranked_indices', list(range(len(tracks))))
-                ranked_tracks = []
-                
-                for idx in ranked_indices:
-                    if idx < len(tracks):
-                        track = tracks[idx].copy()
-                        track['ranking_score'] = len(ranked_indices) - ranked_indices.index(idx)
-                        ranked_tracks.append(track)
-                
-                return json.dumps({
-                    'ranked_tracks': ranked_tracks,
-                    'reasoning': ranking_result.get('reasoning', ''),
-                    'top_pick_explanation': ranking_result.get('top_pick_explanation', ''),
-                    'ranking_method': 'llm_intelligent'
-                })
-                
-            except json.JSONDecodeError:
-                scored_tracks = []
-                for track in tracks:
-                    score = track.get('relevance_score', 0)
-                    score += track.get('popularity', 0) / 10
-                    if track.get('preview_url'):
-                        score += 5
-                    track['ranking_score'] = score
-                    scored_tracks.append(track)
-                
-                scored_tracks.sort(key=lambda x: x.get('ranking_score', 0), reverse=True)
-                return json.dumps({
-                    'ranked_tracks': scored_tracks,
-                    'reasoning': 'Used fallback ranking based on popularity and availability',
-                    'top_pick_explanation': 'Selected based on overall relevance and data quality',
-                    'ranking_method': 'fallback_scoring'
-                })
+        except orjson.JSONDecodeError:
+            scored_tracks = []
+            for track in tracks:
+                score = track.get('relevance_score', 0)
+                score += track.get('popularity', 0) / 10
+                if track.get('preview_url'):
+                    score += 5
+                track['ranking_score'] = score
+                scored_tracks.append(track)
             
-        except Exception as e:
-            print(f"Ranking error: {e}")
-            return json.dumps({
-                'error': str(e),
-                'ranked_tracks': data.get('tracks', []),
-                'ranking_method': 'error_fallback'
+            scored_tracks.sort(key=lambda x: x.get('ranking_score', 0), reverse=True)
+            return _dumps({
+                'ranked_tracks': scored_tracks,
+                'reasoning': 'Used fallback ranking based on popularity and availability',
+                'top_pick_explanation': 'Selected based on overall relevance and data quality',
+                'ranking_method': 'fallback_scoring'
             })
     
-    async def _arun(
-        self, 
-        ranking_input: str, 
-        run_manager: Optional[AsyncCallbackManagerForToolRun] = None
-    ) -> str:
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, self._run, ranking_input, run_manager)
-
+    def _error_result(self, e: Exception, data: dict) -> str:
+        print(f"Ranking error: {e}")
+        return _dumps({
+            'error': str(e),
+            'ranked_tracks': data.get('tracks', []),
+            'ranking_method': 'error_fallback'
+        })
+    
+    @staticmethod
+    def _audio_features(estimated_features: dict) -> dict:
+        return {name: estimated_features.get(name, default) for name, default in _AUDIO_FEATURE_DEFAULTS}
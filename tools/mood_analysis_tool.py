@@ -6,7 +6,6 @@ from configs.configurations import config
 from langchain_core.prompts import PromptTemplate
 from langchain.output_parsers import PydanticOutputParser, OutputFixingParser
 from langchain_core.output_parsers import StrOutputParser
-import json
 
 
 class MoodAnalysisTool(BaseTool):
@@ -46,7 +45,7 @@ class MoodAnalysisTool(BaseTool):
         try:
             result = chain.invoke({"user_input": user_input})
             parsed_result = parser.parse(result)
-            return json.dumps(parsed_result.model_dump())
+            return parsed_result.model_dump_json()
             
         except Exception as e:
             print(f"First parsing failed: {e}")
@@ -54,7 +53,7 @@ class MoodAnalysisTool(BaseTool):
                 fixing_parser = OutputFixingParser.from_llm(parser=parser, llm=llm)
                 result = chain.invoke({"user_input": user_input})
                 parsed_result = fixing_parser.parse(result)
-                return json.dumps(parsed_result.model_dump())
+                return parsed_result.model_dump_json()
                 
             except Exception as e2:
                 print(f"Fixing parser also failed: {e2}")
@@ -67,7 +66,7 @@ class MoodAnalysisTool(BaseTool):
                     mood_descriptors=["unknown"],
                     context_factors=["analysis_failed"]
                 )
-                return json.dumps(fallback_mood.model_dump())
+                return fallback_mood.model_dump_json()
 
     async def _arun(
         self, 
@@ -103,7 +102,7 @@ class MoodAnalysisTool(BaseTool):
         try:
             result = await chain.ainvoke({"user_input": user_input})
             parsed_result = parser.parse(result)
-            return json.dumps(parsed_result.model_dump())
+            return parsed_result.model_dump_json()
             
         except Exception as e:
             print(f"Async parsing failed: {e}")
@@ -116,6 +115,6 @@ class MoodAnalysisTool(BaseTool):
                 mood_descriptors=["unknown"],
                 context_factors=["analysis_failed"]
             )
-            return json.dumps(fallback_mood.model_dump())
+            return fallback_mood.model_dump_json()
 
 
@@ -1,13 +1,15 @@
 from langchain.tools import BaseTool
 from langchain.callbacks.manager import CallbackManagerForToolRun, AsyncCallbackManagerForToolRun
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Tuple, Callable
 import json
 import requests
 import asyncio
+import threading
 import time
 from dotenv import load_dotenv
 import os
 from pydantic import PrivateAttr
+from configs.settings import get_config
 
 load_dotenv()
 
@@ -20,11 +22,17 @@ class FreeMusicSearchTool(BaseTool):
     _musicbrainz_base: str = PrivateAttr(default="https://musicbrainz.org/ws/2")
     _audiodb_base: str = PrivateAttr(default="https://www.theaudiodb.com/api/v1/json/2")
     _lastfm_key: str = PrivateAttr()
+    _request_slots: threading.BoundedSemaphore = PrivateAttr()
     
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         lastfm_key = os.getenv('LASTFM_API_KEY', '')
         object.__setattr__(self, '_lastfm_key', lastfm_key)
+        # Caps provider requests in flight across every concurrent search, not just within one
+        object.__setattr__(
+            self, '_request_slots',
+            threading.BoundedSemaphore(get_config().music_api.max_concurrent_requests)
+        )
         
         print(f"🎵 Free Music Search Tool Initialized")
         print(f"Deezer API: (No key required)")
@@ -43,52 +51,15 @@ class FreeMusicSearchTool(BaseTool):
         print(f"="*50)
         
         try:
-            if isinstance(search_params, str):
-                try:
-                    params = json.loads(search_params)
-                except json.JSONDecodeError:
-                    params = {"query": search_params}
-            else:
-                params = search_params
-            
-            search_query = params.get('query', '')
-            if not search_query:
-                search_query = self._generate_search_query(params)
-            
+            search_query = self._get_search_query(search_params)
             print(f"Search Query: '{search_query}'")
             all_tracks = []
             
-            print(f"\nSearching Deezer...")
-            deezer_tracks = self._search_deezer(search_query)
-            all_tracks.extend(deezer_tracks)
-            
-            print(f"\nSearching iTunes...")
-            itunes_tracks = self._search_itunes(search_query)
-            all_tracks.extend(itunes_tracks)
-            
-            print(f"\nSearching MusicBrainz...")
-            mb_tracks = self._search_musicbrainz(search_query)
-            all_tracks.extend(mb_tracks)
-            
-            print(f"\nSearching TheAudioDB...")
-            audiodb_tracks = self._search_audiodb(search_query)
-            all_tracks.extend(audiodb_tracks)
+            for provider_name, search_fn in self._get_providers():
+                print(f"\nSearching {provider_name}...")
+                all_tracks.extend(search_fn(search_query))
             
-            if self._lastfm_key:
-                print(f"\nSearching Last.fm...")
-                lastfm_tracks = self._search_lastfm(search_query)
-                all_tracks.extend(lastfm_tracks)
-            
-            unique_tracks = self._deduplicate_and_rank(all_tracks)
-            
-            print(f"\nFound {len(unique_tracks)} unique tracks from {len(all_tracks)} total results")
-            
-            return json.dumps({
-                'tracks': unique_tracks[:30],  # Limit results
-                'total_found': len(unique_tracks),
-                'sources_used': ['deezer', 'itunes', 'musicbrainz', 'audiodb'] + (['lastfm'] if self._lastfm_key else []),
-                'search_query': search_query
-            })
+            return self._build_search_response(search_query, all_tracks)
             
         except Exception as e:
             print(f"Error in free music search: {e}")
@@ -98,6 +69,43 @@ class FreeMusicSearchTool(BaseTool):
                 'total_found': 0
             })
     
+    def _get_search_query(self, search_params) -> str:
+        if isinstance(search_params, str):
+            try:
+                params = json.loads(search_params)
+            except json.JSONDecodeError:
+                params = {"query": search_params}
+        else:
+            params = search_params
+        
+        search_query = params.get('query', '')
+        if not search_query:
+            search_query = self._generate_search_query(params)
+        return search_query
+    
+    def _get_providers(self) -> List[Tuple[str, Callable[[str], List[Dict]]]]:
+        providers = [
+            ('Deezer', self._search_deezer),
+            ('iTunes', self._search_itunes),
+            ('MusicBrainz', self._search_musicbrainz),
+            ('TheAudioDB', self._search_audiodb)
+        ]
+        if self._lastfm_key:
+            providers.append(('Last.fm', self._search_lastfm))
+        return providers
+    
+    def _build_search_response(self, search_query: str, all_tracks: List[Dict]) -> str:
+        unique_tracks = self._deduplicate_and_rank(all_tracks)
+        
+        print(f"\nFound {len(unique_tracks)} unique tracks from {len(all_tracks)} total results")
+        
+        return json.dumps({
+            'tracks': unique_tracks[:30],  # Limit results
+            'total_found': len(unique_tracks),
+            'sources_used': ['deezer', 'itunes', 'musicbrainz', 'audiodb'] + (['lastfm'] if self._lastfm_key else []),
+            'search_query': search_query
+        })
+    
     def _generate_search_query(self, params: Dict) -> str:
         query_parts = []
         if params.get('mood_descriptors'):
@@ -394,6 +402,35 @@ class FreeMusicSearchTool(BaseTool):
         search_params: str, 
         run_manager: Optional[AsyncCallbackManagerForToolRun] = None
     ) -> str:
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, self._run, search_params, run_manager)
+        """Query all providers concurrently instead of one after another"""
+        try:
+            search_query = self._get_search_query(search_params)
+            print(f"Search Query: '{search_query}' (concurrent)")
+            
+            def fetch(search_fn) -> List[Dict]:
+                with self._request_slots:
+                    return search_fn(search_query)
+            
+            providers = self._get_providers()
+            results = await asyncio.gather(
+                *(asyncio.to_thread(fetch, fn) for _, fn in providers),
+                return_exceptions=True
+            )
+            
+            all_tracks = []
+            for (provider_name, _), result in zip(providers, results):
+                if isinstance(result, Exception):
+                    print(f"{provider_name} error: {result}")
+                    continue
+                all_tracks.extend(result)
+            
+            return self._build_search_response(search_query, all_tracks)
+            
+        except Exception as e:
+            print(f"Error in free music search: {e}")
+            return json.dumps({
+                'error': str(e),
+                'tracks': [],
+                'total_found': 0
+            })
 
@@ -150,7 +150,7 @@ class ModernMusicRecommender:
             query = inputs.get('input', '')
             mood_tool = self.tools["mood_analyzer"]
             
-            result = mood_tool.invoke(query)
+            result = await mood_tool.ainvoke(query)
             mood_data = json.loads(result) if isinstance(result, str) else result
             
             return mood_data
@@ -168,7 +168,7 @@ class ModernMusicRecommender:
             query = inputs.get('input', '')
             context_tool = self.tools["musical_context_extractor"]
             
-            result = context_tool.invoke(query)
+            result = await context_tool.ainvoke(query)
             context_data = json.loads(result) if isinstance(result, str) else result
             
             return context_data
@@ -195,7 +195,7 @@ class ModernMusicRecommender:
             }
             
             search_tool = self.tools["free_music_search"]
-            result = search_tool.invoke(json.dumps(search_params))
+            result = await search_tool.ainvoke(json.dumps(search_params))
             search_data = json.loads(result) if isinstance(result, str) else result
             
             return search_data
@@ -214,7 +214,7 @@ class ModernMusicRecommender:
             
             # Take top tracks for enrichment
             enrichment_tool = self.tools["lastfm_enrichment"]
-            result = enrichment_tool.invoke(json.dumps(tracks[:10]))
+            result = await enrichment_tool.ainvoke(json.dumps(tracks[:10]))
             enrichment_data = json.loads(result) if isinstance(result, str) else result
             
             return enrichment_data
@@ -241,7 +241,7 @@ class ModernMusicRecommender:
             }
             
             ranking_tool = self.tools["intelligent_ranking"]
-            result = ranking_tool.invoke(json.dumps(ranking_input))
+            result = await ranking_tool.ainvoke(json.dumps(ranking_input))
             ranking_data = json.loads(result) if isinstance(result, str) else result
             
             return ranking_data
@@ -293,7 +293,7 @@ Keep it concise but meaningful (2-3 sentences).
             
             response_chain = response_prompt | self.llm | StrOutputParser()
             
-            natural_response = response_chain.invoke({
+            natural_response = await response_chain.ainvoke({
                 'user_input': inputs.get('input', ''),
                 'mood_summary': f"Mood: {mood_data.get('primary_emotion', 'neutral')} (intensity: {mood_data.get('intensity', 0.5)})",
                 'context_summary': f"Activity: {context_data.get('activity_type', 'general')}, Energy: {context_data.get('energy_preference', 0.5)}",
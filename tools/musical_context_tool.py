@@ -6,7 +6,6 @@ from langchain_core.output_parsers import StrOutputParser
 from langchain.output_parsers import PydanticOutputParser, OutputFixingParser
 from models.models import MusicalContext
 from configs.configurations import config
-import json
 
 
 class MusicalContextTool(BaseTool):
@@ -56,7 +55,7 @@ class MusicalContextTool(BaseTool):
         try:
             result = chain.invoke({"user_input": user_input})
             parsed_result = parser.parse(result)
-            return json.dumps(parsed_result.model_dump())
+            return parsed_result.model_dump_json()
             
         except Exception as e:
             print(f"Context extraction failed: {e}")
@@ -64,7 +63,7 @@ class MusicalContextTool(BaseTool):
                 fixing_parser = OutputFixingParser.from_llm(parser=parser, llm=llm)
                 result = chain.invoke({"user_input": user_input})
                 parsed_result = fixing_parser.parse(result)
-                return json.dumps(parsed_result.model_dump())
+                return parsed_result.model_dump_json()
             except Exception as e2:
                 print(f"Fixing parser also failed: {e2}")
                 fallback_context = MusicalContext(
@@ -77,7 +76,7 @@ class MusicalContextTool(BaseTool):
                     sonic_descriptors=["pleasant"],
                     instrumental_preferences=["any"]
                 )
-                return json.dumps(fallback_context.model_dump())
+                return fallback_context.model_dump_json()
 
     async def _arun(self, user_input: str, run_manager: Optional[AsyncCallbackManagerForToolRun] = None) -> str:
         llm = config.llm
@@ -110,7 +109,7 @@ class MusicalContextTool(BaseTool):
         try:
             result = await chain.ainvoke({"user_input": user_input})
             parsed_result = parser.parse(result)
-            return json.dumps(parsed_result.model_dump())
+            return parsed_result.model_dump_json()
             
         except Exception as e:
             print(f"Async context extraction failed: {e}")
@@ -124,5 +123,5 @@ class MusicalContextTool(BaseTool):
                 sonic_descriptors=["pleasant"],
                 instrumental_preferences=["any"]
             )
-            return json.dumps(fallback_context.model_dump())
+            return fallback_context.model_dump_json()
 
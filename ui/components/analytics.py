@@ -4,6 +4,7 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 import json
+from collections import Counter
 from datetime import datetime, timedelta
 from io import BytesIO
 
@@ -48,20 +49,21 @@ class AnalyticsPage:
             self._show_export_reports(user, analytics_data)
     
     def _get_comprehensive_analytics(self, user_id: int) -> Dict:
-        interactions_df = pd.read_sql_query(
-            'SELECT * FROM interactions WHERE user_id = ? ORDER BY timestamp',
-            'sqlite:///'+self.db_manager.db_path, params=(user_id,)
-        )
-        
-        feedback_df = pd.read_sql_query(
-            'SELECT * FROM feedback WHERE user_id = ? ORDER BY timestamp',
-           'sqlite:///'+self.db_manager.db_path, params=(user_id,)
-        )
-        
-        model_performance_df = pd.read_sql_query(
-            'SELECT * FROM user_model_performance WHERE user_id = ? ORDER BY timestamp',
-            'sqlite:///'+self.db_manager.db_path, params=(user_id,)
-        )
+        with self.db_manager.acquire() as conn:
+            interactions_df = pd.read_sql_query(
+                'SELECT * FROM interactions WHERE user_id = ? ORDER BY timestamp',
+                conn, params=(user_id,)
+            )
+            
+            feedback_df = pd.read_sql_query(
+                'SELECT * FROM feedback WHERE user_id = ? ORDER BY timestamp',
+                conn, params=(user_id,)
+            )
+            
+            model_performance_df = pd.read_sql_query(
+                'SELECT * FROM user_model_performance WHERE user_id = ? ORDER BY timestamp',
+                conn, params=(user_id,)
+            )
         
 
         total_interactions = len(interactions_df)
@@ -423,11 +425,11 @@ class AnalyticsPage:
             col1, col2 = st.columns(2)
             
             with col1:
-                mood_counts = pd.Series(mood_data).value_counts()
+                mood_names, mood_counts = zip(*Counter(mood_data).most_common())
                 
                 fig1 = px.pie(
-                    values=mood_counts.values,
-                    names=mood_counts.index,
+                    values=mood_counts,
+                    names=mood_names,
                     title="Mood Distribution"
                 )
                 st.plotly_chart(fig1, use_container_width=True)
@@ -690,24 +692,22 @@ class AnalyticsPage:
         return genre_counts
     
     def _get_genre_ratings(self, feedback_df: pd.DataFrame) -> Dict:
-        genre_ratings = {}
+        rating_sums = Counter()
+        rating_counts = Counter()
         
-        for _, row in feedback_df.iterrows():
+        for tags_json, rating in zip(feedback_df['track_tags'].to_numpy(), feedback_df['rating'].to_numpy()):
             try:
-                tags = json.loads(row.get('track_tags', '[]'))
-                rating = row['rating']
-                
+                tags = json.loads(tags_json or '[]')
                 for tag in tags[:2]:  
-                    if tag not in genre_ratings:
-                        genre_ratings[tag] = []
-                    genre_ratings[tag].append(rating)
+                    rating_sums[tag] += rating
+                    rating_counts[tag] += 1
             except:
                 continue
         
         return {
-            genre: sum(ratings) / len(ratings)
-            for genre, ratings in genre_ratings.items()
-            if len(ratings) >= 2  
+            genre: rating_sums[genre] / count
+            for genre, count in rating_counts.items()
+            if count >= 2  
         }
     
     def _extract_mood_data(self, interactions_df: pd.DataFrame) -> List:
@@ -6,6 +6,7 @@ from datetime import datetime
 from core.hybrid_system import RecommendationRequest
 from ui.components.audio_player import AudioPlayer
 from ui.components.track_card import TrackCard
+from utils.cache import invalidate_user_cache
 
 class HomePage:
     def __init__(self):
@@ -24,7 +25,7 @@ class HomePage:
             self._show_context_panel(user, hybrid_system)
         
         # Show recommendations if available
-        if hasattr(st.session_state, 'current_recommendations'):
+        if st.session_state.get('current_recommendations'):
             self._show_recommendations(user, hybrid_system, db_manager)
     
     def _show_query_interface(self, user: Dict, hybrid_system):
@@ -250,11 +251,14 @@ class HomePage:
             # Get recommendations
             try:
                 response = asyncio.run(hybrid_system.get_recommendations(request))
+                invalidate_user_cache()
                 
                 # Store in session
-                st.session_state.current_recommendations = response
-                st.session_state.current_query = query
-                st.session_state.recommendation_timestamp = datetime.now()
+                st.session_state.current_recommendations = {
+                    'response': response,
+                    'query': query,
+                    'timestamp': datetime.now()
+                }
                 
                 st.success(f"🎉 Found {len(response.tracks)} personalized recommendations!")
                 st.rerun()
@@ -266,8 +270,9 @@ class HomePage:
     def _show_recommendations(self, user: Dict, hybrid_system, db_manager):
         """Show the recommendations results"""
         
-        recommendations = st.session_state.current_recommendations
-        query = st.session_state.current_query
+        current = st.session_state.current_recommendations
+        recommendations = current['response']
+        query = current['query']
         
         st.markdown("---")
         
@@ -329,7 +334,8 @@ class HomePage:
             feedback_result = self.track_card.render_card(
                 track=track,
                 user_id=user['id'],
-                interaction_id=getattr(st.session_state, 'interaction_id', None),
+                # Read on the rerun that renders the cards; by then the log write has landed
+                interaction_id=st.session_state.current_recommendations['response'].interaction_id,
                 on_feedback=lambda feedback_data: self._handle_feedback(
                     feedback_data, hybrid_system
                 ),
@@ -470,13 +476,23 @@ class HomePage:
                 user_id=feedback_data['user_id'],
                 track_id=feedback_data['track_id'],
                 rating=feedback_data['rating'],
-                feedback_text=feedback_data.get('feedback_text', '')
+                feedback_text=feedback_data.get('feedback_text', ''),
+                track_details=feedback_data
             ))
-            
-            return result
+            invalidate_user_cache()
             
         except Exception as e:
             return {'success': False, 'error': str(e)}
+        
+        if result.get('success'):
+            # The sidebar's rating stats sit outside this page's fragment, so rerun the whole app;
+            # toasts outlive the rerun, unlike the card's inline messages
+            st.toast("🎉 Thank you for your feedback!")
+            if result.get('model_updated'):
+                st.toast("🧠 Your AI model has been updated with this feedback!")
+            st.rerun(scope="app")
+        
+        return result
 
 # Usage function for main app
 def show_home_page(user: Dict, hybrid_system, db_manager):
@@ -0,0 +1,35 @@
+import streamlit as st
+from typing import TYPE_CHECKING, Dict, Optional
+
+from database.manager import DatabaseManager
+from services.user_service import UserService
+
+if TYPE_CHECKING:
+    from core.hybrid_system import HybridMusicSystem
+
+@st.cache_resource
+def get_db_manager(db_path: str, pool_size: int = 8, pool_timeout: float = 5) -> DatabaseManager:
+    return DatabaseManager(db_path, pool_size=pool_size, pool_timeout=pool_timeout)
+
+@st.cache_resource
+def get_user_service(_db_manager: DatabaseManager) -> UserService:
+    return UserService(_db_manager)
+
+@st.cache_resource
+def get_hybrid_system(_config, _db_manager: DatabaseManager) -> "HybridMusicSystem":
+    # Deferred: pulls in the LLM/RL/tools stack, which the login page does not need
+    from core.hybrid_system import HybridMusicSystem
+    return HybridMusicSystem(_config, _db_manager)
+
+@st.cache_data(ttl=60, show_spinner=False)
+def get_user_stats(_user_service: UserService, user_id: int) -> Dict:
+    return _user_service.get_user_stats(user_id)
+
+@st.cache_data(ttl=60, show_spinner=False)
+def get_user_by_username(_user_service: UserService, username: str) -> Optional[Dict]:
+    return _user_service.get_user_by_username(username)
+
+def invalidate_user_cache():
+    """Drop cached user reads after any write that changes them"""
+    get_user_stats.clear()
+    get_user_by_username.clear()
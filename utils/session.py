@@ -1,11 +1,13 @@
+import os
 import streamlit as st
-from datetime import datetime, timedelta
+import time
+from datetime import timedelta
 from typing import Dict, Optional
-import secrets
 
 class SessionManager:
     def __init__(self):
         self.session_timeout = timedelta(hours=8)
+        self._timeout_sec = self.session_timeout.total_seconds()
         if 'authenticated' not in st.session_state:
             st.session_state.authenticated = False
         if 'user_data' not in st.session_state:
@@ -14,40 +16,39 @@ class SessionManager:
             st.session_state.session_token = None
         if 'login_time' not in st.session_state:
             st.session_state.login_time = None
+        if 'current_recommendations' not in st.session_state:
+            st.session_state.current_recommendations = {}
     
     def is_authenticated(self) -> bool:
-        if not st.session_state.authenticated:
+        state = st.session_state
+        if not state.authenticated or not state.login_time:
             return False
         
-        if not st.session_state.login_time:
-            return False
-        
-        login_time = datetime.fromisoformat(st.session_state.login_time)
-        if datetime.now() - login_time > self.session_timeout:
+        if time.monotonic() - state.login_time > self._timeout_sec:
             self.logout()
             return False
         
         return True
     
     def login(self, user_data: Dict, remember_me: bool = False):
-        session_token = secrets.token_urlsafe(32)
+        session_token = os.urandom(16).hex()
         st.session_state.authenticated = True
         st.session_state.user_data = user_data
         st.session_state.session_token = session_token
-        st.session_state.login_time = datetime.now().isoformat()
+        st.session_state.login_time = time.monotonic()
         if remember_me:
             self.session_timeout = timedelta(days=30)
+            self._timeout_sec = self.session_timeout.total_seconds()
     
     def logout(self):
         st.session_state.authenticated = False
         st.session_state.user_data = None
         st.session_state.session_token = None
         st.session_state.login_time = None
-        for key in list(st.session_state.keys()):
-            if key.startswith('current_recommendations'):
-                del st.session_state[key]
+        st.session_state.current_recommendations = {}
     
     def get_current_user(self) -> Optional[Dict]:
+        """Authenticated user's data, or None; callers need not check is_authenticated first"""
         if self.is_authenticated():
             return st.session_state.user_data
         return None
@@ -58,4 +59,4 @@ class SessionManager:
     
     def extend_session(self):
         if self.is_authenticated():
-            st.session_state.login_time = datetime.now().isoformat()
+            st.session_state.login_time = time.monotonic()
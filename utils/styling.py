@@ -1,7 +1,6 @@
 import streamlit as st
 
-def apply_custom_css():
-    st.markdown("""
+_CUSTOM_CSS = """
     <style>
         /* Main app styling */
         .stApp {
@@ -162,7 +161,10 @@ def apply_custom_css():
             background: linear-gradient(45deg, #5a67d8, #6b46c1);
         }
     </style>
-    """, unsafe_allow_html=True)
+    """
+
+def apply_custom_css():
+    st.markdown(_CUSTOM_CSS, unsafe_allow_html=True)
 
 def create_metric_card(title: str, value: str, delta: str = None, color: str = "blue") -> str:
     """Create a styled metric card"""